@@ -0,0 +1 @@
+# 這個文件用來標記 benchmarks 為 Python 包，以 python -m benchmarks.<名稱> 執行效能測試
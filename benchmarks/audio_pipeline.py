@@ -0,0 +1,111 @@
+"""比較播放管線每個 CPU 核心可同時支撐的串流數
+
+用法：
+    python -m benchmarks.audio_pipeline [音訊檔或串流網址] [--seconds 60]
+
+未指定來源時以 FFmpeg 產生一段 WebM/Opus 測試音訊（需要 ffmpeg 與 libopus）。
+每種管線都不受即時播放速度限制地讀完 seconds 秒的音訊，並統計本行程與 FFmpeg 子行程的
+CPU 時間；一個串流每秒需要 CPU 秒數的倒數即為每核心可支撐的串流數。
+
+    pcm            舊的 play_next：FFmpeg 解碼為 PCM，Python 逐幀調整音量，discord.py 以 libopus 編碼
+    ffmpeg-volume  opus 模式且音量不是 100%：FFmpeg 解碼時以 volume 濾鏡調整音量，discord.py 以 libopus 編碼
+    opus-copy      opus 模式、來源已是 Opus 且音量 100%：FFmpeg 只轉換封裝，直接轉送 Opus 封包
+
+只計算產生 Opus 封包的成本，不包含 discord.py 加密與送出封包的部分（各管線相同）。
+"""
+import argparse
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+import discord
+
+from cogs import music
+from cogs.music import create_audio_source
+
+FRAMES_PER_SECOND = 50
+
+
+def generate_sample(path, seconds):
+    """產生雙聲道 48kHz 的 WebM/Opus 測試音訊"""
+    subprocess.run(
+        [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={seconds}',
+            '-f', 'lavfi', '-i', f'anoisesrc=color=pink:sample_rate=48000:amplitude=0.1:duration={seconds}',
+            '-filter_complex', 'amerge=inputs=2', '-ac', '2', '-c:a', 'libopus', '-b:a', '128k', path,
+        ],
+        check=True,
+    )
+
+
+def cpu_seconds():
+    """本行程與已結束子行程（FFmpeg）的 CPU 時間合計"""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def run_pipeline(source_url, mode, codec, volume, seconds):
+    """讀完 seconds 秒的音訊，回傳 (音訊秒數, CPU 秒數, 經過秒數)"""
+    encoder = discord.opus.Encoder()
+    start_cpu, start_wall = cpu_seconds(), time.perf_counter()
+    source = create_audio_source(source_url, codec, volume, mode=mode)
+    frames = 0
+    try:
+        while frames < seconds * FRAMES_PER_SECOND:
+            data = source.read()
+            if not data:
+                break
+            if not source.is_opus():
+                # 與 discord.py 的 AudioPlayer 相同，PCM 來源在送出前以 libopus 編碼
+                encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+            frames += 1
+    finally:
+        # cleanup 會等待 FFmpeg 結束，子行程的 CPU 時間才會計入 RUSAGE_CHILDREN
+        source.cleanup()
+    return frames / FRAMES_PER_SECOND, cpu_seconds() - start_cpu, time.perf_counter() - start_wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', nargs='?', help='音訊檔或串流網址，預設產生 WebM/Opus 測試音訊')
+    parser.add_argument('--seconds', type=int, default=60, help='每種管線讀取的音訊秒數')
+    parser.add_argument('--codec', default='opus', help='來源的音訊編碼，決定 opus-copy 是否可用')
+    parser.add_argument('--opus-lib', help='libopus 共享函式庫路徑，預設由 discord.py 自動尋找')
+    args = parser.parse_args()
+
+    if args.opus_lib:
+        discord.opus.load_opus(args.opus_lib)
+    elif not discord.opus.is_loaded():
+        discord.opus._load_default()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = args.source
+        if source is None:
+            source = os.path.join(directory, 'sample.webm')
+            generate_sample(source, args.seconds)
+        if not source.startswith(('http://', 'https://')):
+            # 重新連線參數只適用於網路串流，本地檔案需移除
+            music.FFMPEG_OPTIONS = {**music.FFMPEG_OPTIONS, 'before_options': ''}
+
+        pipelines = [
+            ('pcm', 'pcm', 0.5),
+            ('ffmpeg-volume', 'opus', 0.5),
+            ('opus-copy', 'opus', 1.0),
+        ]
+        print(f"{'管線':<14} {'音訊秒數':>8} {'CPU 秒數':>9} {'經過秒數':>8} {'串流數/核心':>10}")
+        for name, mode, volume in pipelines:
+            if name == 'opus-copy' and args.codec != 'opus':
+                continue
+            audio, cpu, wall = run_pipeline(source, mode, args.codec, volume, args.seconds)
+            streams = audio / cpu if cpu > 0 else float('inf')
+            print(f"{name:<14} {audio:>8.1f} {cpu:>9.2f} {wall:>8.2f} {streams:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
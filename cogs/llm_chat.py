@@ -1,35 +1,192 @@
 import os
+import re
+import inspect
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import asyncio
+import contextvars
+import time
 from datetime import datetime, timezone, timedelta
-import requests
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.agents import initialize_agent, AgentType, Tool
-from langchain.agents.agent import AgentOutputParser
 from typing import Any, Dict
+from utils.http import create_session
+from utils.page_cache import PageCache
+from utils.text import estimate_tokens, fit_to_budget, split_chunks, truncate_tokens, normalize_text
+from utils.intents import match_intent
+from utils.conversation import ConversationStore
+from utils.scheduler import RequestScheduler, SchedulerBusyError
+from utils.singleflight import SingleFlight
+from utils.images import ImagePipeline
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 GOOGLE_CSE_ID = os.getenv('GOOGLE_CSE_ID')
+# search_web 同時抓取搜尋結果網頁的總時間上限（秒），逾時的網頁只保留搜尋摘要
+SEARCH_DEADLINE = float(os.getenv('SEARCH_DEADLINE', '8'))
+# 網頁正文快取：ttl 內直接使用，超過後以 ETag/Last-Modified 向伺服器驗證
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', '256'))
+PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', '600'))
+PAGE_CACHE_MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', '86400'))
+PAGE_CACHE_DIR = os.getenv('PAGE_CACHE_DIR') or None
+# 交給 LLM 的網頁正文 token 上限：summarize_url 每次呼叫、search_web 所有結果合計
+PAGE_TOKEN_BUDGET = int(os.getenv('PAGE_TOKEN_BUDGET', '3000'))
+SEARCH_TOKEN_BUDGET = int(os.getenv('SEARCH_TOKEN_BUDGET', '6000'))
+# 超長網頁先分塊平行摘要（map-reduce）再交給 agent，預設關閉
+PAGE_MAP_REDUCE = os.getenv('PAGE_MAP_REDUCE', '').lower() in ('1', 'true', 'yes', 'on')
+PAGE_CHUNK_TOKENS = int(os.getenv('PAGE_CHUNK_TOKENS', '4000'))
+PAGE_MAX_CHUNKS = int(os.getenv('PAGE_MAX_CHUNKS', '8'))
+# 對話紀錄：每段對話的 token 上限、閒置淘汰時間（秒）、最多保留幾段對話、是否依使用者分開
+CHAT_HISTORY_TOKENS = int(os.getenv('CHAT_HISTORY_TOKENS', '4000'))
+CHAT_IDLE_TTL = int(os.getenv('CHAT_IDLE_TTL', '3600'))
+CHAT_MAX_CONVERSATIONS = int(os.getenv('CHAT_MAX_CONVERSATIONS', '1000'))
+CHAT_HISTORY_PER_USER = os.getenv('CHAT_HISTORY_PER_USER', '').lower() in ('1', 'true', 'yes', 'on')
+# 移出歷史的舊對話會在背景壓縮成摘要，摘要的 token 上限
+CHAT_SUMMARY_TOKENS = int(os.getenv('CHAT_SUMMARY_TOKENS', '500'))
+# 背景壓縮摘要同時呼叫 LLM 的上限，避免佔用回覆使用者的名額
+CHAT_SUMMARY_CONCURRENCY = int(os.getenv('CHAT_SUMMARY_CONCURRENCY', '1'))
+# 串流回覆：邊產生邊編輯 Discord 訊息，編輯間隔（秒）需避開速率限制
+LLM_STREAMING = os.getenv('LLM_STREAMING', 'on').lower() in ('1', 'true', 'yes', 'on')
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.2'))
+# LLM 請求排程：同時執行總數、每位使用者、每個頻道的上限，以及排隊上限
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+LLM_PER_USER = int(os.getenv('LLM_PER_USER', '1'))
+LLM_PER_CHANNEL = int(os.getenv('LLM_PER_CHANNEL', '2'))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '20'))
+LLM_USER_QUEUE = int(os.getenv('LLM_USER_QUEUE', '2'))
+# 相同的進行中請求只執行一次，結果再沿用幾秒：工具查詢與同一對話中的相同問題
+TOOL_RESULT_TTL = int(os.getenv('TOOL_RESULT_TTL', '120'))
+PROMPT_RESULT_TTL = int(os.getenv('PROMPT_RESULT_TTL', '30'))
+# 圖片前處理：最長邊像素、JPEG 品質、每則訊息最多處理幾張圖片
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '1024'))
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '85'))
+IMAGE_MAX_COUNT = int(os.getenv('IMAGE_MAX_COUNT', '4'))
+# 載入模組後立即在背景建立 LLM agent；關閉時改為第一則訊息才建立
+LLM_WARMUP = os.getenv('LLM_WARMUP', 'on').lower() in ('1', 'true', 'yes', 'on')
+# agent 模式：native 使用 Gemini 原生工具呼叫（同一步的多個工具並行執行），react 為舊的文字解析 agent
+AGENT_MODE = os.getenv('AGENT_MODE', 'native').lower()
+# 每次回覆最多呼叫幾次帶工具的 LLM，用完後要求模型直接回答
+AGENT_MAX_STEPS = int(os.getenv('AGENT_MAX_STEPS', '3'))
+
+URL_PATTERN = re.compile(r"https?://[^\s]+")
+# 目前這次 agent 執行的 ToolContext，每次執行各自獨立，並行執行時不會互相干擾
+current_tool_context = contextvars.ContextVar('current_tool_context', default=None)
+MUSIC_COMMAND_PATTERN = re.compile(r"!(play|skip|pause|resume|leave|join|queue)\b\s*(.*)", re.IGNORECASE)
+# 工具回傳的錯誤訊息，含有這些字串的結果不快取，下次查詢會重新執行
+TOOL_ERROR_MARKERS = ("(無法擷取內容", "搜尋失敗", "搜尋時發生錯誤", "未設定 GOOGLE_API_KEY")
+PAGE_HEADERS = {
+    'Referer': 'https://www.google.com',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+}
+
+
+def extract_main_text(html):
+    """從 HTML 擷取正文，BeautifulSoup 解析較耗 CPU，應在執行緒中呼叫"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    main_content = (
+        soup.find('main') or
+        soup.find('article') or
+        soup.find('div', {'id': 'content'}) or
+        soup.find('div', {'class': 'content'}) or
+        soup.body
+    )
+    if main_content is None:
+        return ""
+    for tag in main_content(['script', 'style', 'header', 'footer', 'nav', 'form', 'aside']):
+        tag.decompose()
+    raw_text = main_content.get_text(separator='\n', strip=True)
+    lines = [line.strip() for line in raw_text.splitlines() if line.strip()]
+    return '\n'.join(lines)
+
+
+class ToolContext:
+    """單次 agent 執行期間工具產生的副作用，執行結束後由 on_message 處理"""
+
+    def __init__(self):
+        self.music_commands = []  # 依序要執行的音樂指令，例如 '!play Luther'
+        self._claimed = False
+
+    def claim(self):
+        """多個訊息共用同一次執行結果時，只有第一個呼叫者會取得執行副作用的權利"""
+        if self._claimed:
+            return False
+        self._claimed = True
+        return True
+
+    def add_music_command(self, cmd):
+        self.music_commands.append(cmd)
+        return cmd
+
+
+def as_coroutine(func):
+    """將不會阻塞的同步函式包裝成協程，讓 agent 以 ainvoke 直接在事件迴圈中呼叫"""
+    async def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def is_cacheable_result(result):
+    """工具結果中沒有任何錯誤訊息時才快取；部分網頁擷取失敗的結果也不快取"""
+    return not any(marker in result for marker in TOOL_ERROR_MARKERS)
+
+
+def record_music_command(cmd):
+    """記錄音樂指令到目前的 ToolContext，不在 agent 執行中時只回傳指令"""
+    tool_context = current_tool_context.get()
+    if tool_context is not None:
+        tool_context.add_music_command(cmd)
+    return cmd
+
 
 class LlmChatCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.chat_history = []
-        self.last_music_command = None
+        self.http = None  # 共用 aiohttp 連線池，於 cog_load 建立
+        self.page_cache = PageCache(
+            maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL, max_age=PAGE_CACHE_MAX_AGE, directory=PAGE_CACHE_DIR
+        )
+        self.conversations = ConversationStore(
+            max_tokens=CHAT_HISTORY_TOKENS,
+            idle_ttl=CHAT_IDLE_TTL,
+            max_conversations=CHAT_MAX_CONVERSATIONS,
+            per_user=CHAT_HISTORY_PER_USER,
+        )
+        self._background_tasks = set()
+        self._summary_limit = asyncio.Semaphore(max(1, CHAT_SUMMARY_CONCURRENCY))
+        self.scheduler = RequestScheduler(
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            per_user=LLM_PER_USER,
+            per_channel=LLM_PER_CHANNEL,
+            max_queue=LLM_MAX_QUEUE,
+            user_queue=LLM_USER_QUEUE,
+        )
+        self.tool_flight = SingleFlight(ttl=TOOL_RESULT_TTL)
+        self.prompt_flight = SingleFlight(ttl=PROMPT_RESULT_TTL)
+        self.images = ImagePipeline(max_edge=IMAGE_MAX_EDGE, quality=IMAGE_QUALITY)
+
+        # LLM、工具與 agent 依賴 langchain 等大型套件，延後到第一次使用（或背景預熱）才建立
+        self.llm = None
+        self.tools = None
+        self.agent = None
+        self._agent_lock = asyncio.Lock()
+        self._warmup = None
+
+    def _build_agent(self):
+        """匯入 langchain 相關套件並建立 LLM、工具與 agent（同步，於執行緒中執行）"""
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        from langchain_core.tools import Tool
 
         # 初始化 LLM
-        self.llm = ChatGoogleGenerativeAI(
+        llm = ChatGoogleGenerativeAI(
             model="gemini-flash-lite-latest",
             google_api_key=GOOGLE_API_KEY,
             temperature=0.7,
-            streaming=False,
+            streaming=LLM_STREAMING,
         )
 
         # 註冊 tools
-        self.tools = []
+        tools = []
         music_cmds = [
             ("play", self.play_tool, "播放音樂，參數為歌名。例如：play('Luther') 會輸出 '!play Luther'"),
             ("skip", self.skip_tool, "跳過當前歌曲，無需參數，會輸出 '!skip'"),
@@ -39,32 +196,35 @@ class LlmChatCog(commands.Cog):
             ("join", self.join_tool, "加入語音頻道，無需參數，會輸出 '!join'"),
         ]
         for name, func, desc in music_cmds:
-            self.tools.append(Tool(name=name, func=func, description=desc))
-        self.tools.append(Tool(
+            tools.append(Tool(name=name, func=func, coroutine=as_coroutine(func), description=desc))
+        tools.append(Tool(
             name="get_time",
             func=self.get_time,
+            coroutine=as_coroutine(self.get_time),
             description="取得現在的台北時間，無需參數，會回傳格式化的時間字串。",
         ))
-        self.tools.append(Tool(
+        tools.append(Tool(
             name="search_web",
-            func=self.search_web,
+            func=None,
+            coroutine=self.search_web,
             description="使用 Google 搜尋，參數為查詢關鍵字，會回傳前幾條摘要。",
         ))
-        self.tools.append(Tool(
+        tools.append(Tool(
             name="summarize_url",
-            func=self.summarize_url,
+            func=None,
+            coroutine=self.summarize_url,
             description="摘要網址內容。參數可以是網址，或是'問題+網址'，會回傳該網址的網頁摘要，若有問題會一併附上。"
         ))
 
-        # 加入 langchain 內建工具：維基百科、YahooFinanceNewsTool
+        # 加入 langchain 內建工具：維基百科、YahooFinanceNewsTool，相同查詢會合併執行
         from langchain_community.tools import WikipediaQueryRun
         from langchain_community.utilities import WikipediaAPIWrapper
         try:
             from langchain_community.tools.yahoo_finance_news import YahooFinanceNewsTool
-            self.tools.append(YahooFinanceNewsTool())
+            tools.append(self.coalesced_tool(YahooFinanceNewsTool()))
         except ImportError:
             pass  # 若未安裝 langchain_community，則略過
-        self.tools.append(WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper()))
+        tools.append(self.coalesced_tool(WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())))
 
         # System prompt
         system_prompt = (
@@ -85,40 +245,102 @@ class LlmChatCog(commands.Cog):
             "3. 系統同時會自動兜底處理常見時間詞彙（如“今天”、“明天”等），但你仍應主動判斷並處理更複雜的時間需求。\n"
             "4. 遇到音樂、搜尋、網頁摘要等需求時，務必使用對應工具，不要直接用文字回覆。"
         )
-        self.agent = initialize_agent(
-            self.tools,
-            self.llm,
-            agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-            verbose=True,
-            handle_parsing_errors=True,
-            agent_kwargs={"system_message": system_prompt}
-        )
+        if AGENT_MODE == "react":
+            from langchain.agents import initialize_agent, AgentType
+            agent = initialize_agent(
+                tools,
+                llm,
+                agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+                verbose=False,
+                handle_parsing_errors=True,
+                max_iterations=AGENT_MAX_STEPS + 1,
+                agent_kwargs={"system_message": system_prompt}
+            )
+        else:
+            from utils.tool_agent import ToolCallingAgent
+            agent = ToolCallingAgent(llm, tools, system_prompt, max_steps=AGENT_MAX_STEPS)
+        # agent 最後指派，ensure_agent 以它判斷是否已建立完成
+        self.llm, self.tools, self.agent = llm, tools, agent
+
+    async def ensure_agent(self):
+        """確保 LLM 與 agent 已建立；匯入與建立在執行緒中進行，不阻塞事件迴圈"""
+        if self.agent is not None:
+            return
+        async with self._agent_lock:
+            if self.agent is not None:
+                return
+            start = time.perf_counter()
+            await asyncio.to_thread(self._build_agent)
+            print(f"LLM agent 已初始化（{time.perf_counter() - start:.2f}s）")
+
+    async def warm_up(self):
+        """在背景預先建立 agent，讓第一則訊息不必等待匯入"""
+        try:
+            await self.ensure_agent()
+        except Exception as e:
+            print(f"預熱 LLM agent 時發生錯誤: {str(e)}")
 
-    # 音樂工具方法
+    # 音樂工具方法：只記錄指令，agent 結束後才在原訊息的上下文中執行
     def play_tool(self, song: str = "") -> str:
         cmd = f"!play {song.strip()}" if song.strip() else "!play"
-        self.last_music_command = cmd
-        return cmd
+        return record_music_command(cmd)
 
     def skip_tool(self, _input: str = "") -> str:
-        self.last_music_command = "!skip"
-        return "!skip"
+        return record_music_command("!skip")
 
     def pause_tool(self, _input: str = "") -> str:
-        self.last_music_command = "!pause"
-        return "!pause"
+        return record_music_command("!pause")
 
     def resume_tool(self, _input: str = "") -> str:
-        self.last_music_command = "!resume"
-        return "!resume"
+        return record_music_command("!resume")
 
     def leave_tool(self, _input: str = "") -> str:
-        self.last_music_command = "!leave"
-        return "!leave"
+        return record_music_command("!leave")
 
     def join_tool(self, _input: str = "") -> str:
-        self.last_music_command = "!join"
-        return "!join"
+        return record_music_command("!join")
+
+    async def vision_reply(self, message, conversation_key, content, images, config):
+        """前處理圖片附件，取得排程名額後以圖片與文字直接詢問 LLM"""
+        image_urls = await asyncio.gather(*(self.images.prepare(self.http, image) for image in images))
+        await self.ensure_agent()
+        async with self.scheduler.slot(message.channel.id, message.author.id):
+            messages = [
+                {"role": "system", "content": "你是一個能夠理解圖片內容的 Discord 助手，請根據用戶的訊息和圖片進行回覆。"},
+                {"role": "user", "content": [{"type": "text", "text": content}] + [
+                    {"type": "image_url", "image_url": {"url": image_url}} for image_url in image_urls
+                ]}
+            ]
+            result = await self.llm.ainvoke(messages, config=config)
+            response = result.content if hasattr(result, "content") else str(result)
+            self.conversations.append(conversation_key, "user", messages[1]["content"])
+            self.conversations.append(conversation_key, "assistant", response)
+            return response
+
+    async def agent_reply(self, message, conversation_key, content, config):
+        """取得排程名額後執行 agent，回傳 (回覆, ToolContext)"""
+        await self.ensure_agent()
+        async with self.scheduler.slot(message.channel.id, message.author.id):
+            # 取得名額後才讀取歷史，包含排隊期間同頻道的其他回覆
+            chat_history = self.conversations.history(conversation_key)
+            result, tool_context = await self.run_agent({"input": content, "chat_history": chat_history}, config)
+            response = result["output"] if isinstance(result, dict) and "output" in result else str(result)
+            self.conversations.append(conversation_key, "user", content)
+            self.conversations.append(conversation_key, "assistant", response)
+            return response, tool_context
+
+    async def run_agent(self, inputs, config):
+        """在事件迴圈中以 ainvoke 執行 agent，回傳 (結果, ToolContext)
+
+        工具在這次執行衍生的 Task 中繼承 current_tool_context，副作用只會寫入這次的 ToolContext。
+        """
+        tool_context = ToolContext()
+        token = current_tool_context.set(tool_context)
+        try:
+            result = await self.agent.ainvoke(inputs, config=config)
+        finally:
+            current_tool_context.reset(token)
+        return result, tool_context
 
     @staticmethod
     def get_time(_input: str = "") -> str:
@@ -127,68 +349,124 @@ class LlmChatCog(commands.Cog):
         now = datetime.now(tz)
         return now.strftime("現在台北時間是 %Y-%m-%d %H:%M:%S")
 
-    @staticmethod
-    def summarize_url(query: str = "") -> str:
-        """
-        摘要網址內容。參數可以是網址，或是'問題+網址'，會回傳該網址的網頁摘要，若有問題會一併附上。
+    async def cog_load(self):
+        self.http = create_session()
+        if LLM_WARMUP:
+            self._warmup = asyncio.create_task(self.warm_up())
+
+    async def cog_unload(self):
+        if self._warmup:
+            self._warmup.cancel()
+        if self.http:
+            await self.http.close()
+
+    def coalesced_tool(self, tool):
+        """包裝 langchain 內建工具為協程，相同的查詢共用一次執行結果
+
+        維基百科與 Yahoo Finance 的客戶端只有同步版本，實際查詢在執行緒中進行。
         """
-        import re
-        import requests
-        from bs4 import BeautifulSoup
-
-        def extract_text_from_url(url):
-            headers = {
-                'User-Agent': (
-                    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
-                    '(KHTML, like Gecko) Chrome/120.0 Safari/537.36'
-                ),
-                'Referer': 'https://www.google.com',
-                'Accept-Encoding': 'gzip, deflate',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
-            }
-            try:
-                response = requests.get(url, headers=headers, timeout=10)
+        from langchain_core.tools import Tool
+
+        async def arun(query: str = "") -> str:
+            key = (tool.name, normalize_text(query))
+            return await self.tool_flight.do(key, lambda: asyncio.to_thread(tool.run, query))
+
+        return Tool(name=tool.name, description=tool.description, func=None, coroutine=arun)
+
+    async def fetch_page_text(self, url):
+        """透過共用連線池下載網頁並擷取正文，優先使用網頁快取"""
+        try:
+            entry = await self.page_cache.get(url)
+            if entry and self.page_cache.is_fresh(entry):
+                return entry['text']
+            headers = dict(PAGE_HEADERS)
+            if entry and entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry and entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+            async with self.http.get(url, headers=headers) as response:
+                if response.status == 304 and entry:
+                    await self.page_cache.revalidated(entry)
+                    return entry['text']
                 response.raise_for_status()
-                soup = BeautifulSoup(response.text, 'html.parser')
-                main_content = (
-                    soup.find('main') or
-                    soup.find('article') or
-                    soup.find('div', {'id': 'content'}) or
-                    soup.find('div', {'class': 'content'}) or
-                    soup.body
-                )
-                for tag in main_content(['script', 'style', 'header', 'footer', 'nav', 'form', 'aside']):
-                    tag.decompose()
-                raw_text = main_content.get_text(separator='\n', strip=True)
-                lines = [line.strip() for line in raw_text.splitlines() if line.strip()]
-                clean_text = '\n'.join(lines)
-                return clean_text
-            except Exception as e:
-                return f"(無法擷取內容: {e})"
+                html = await response.text(errors='replace')
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+            text = await asyncio.get_running_loop().run_in_executor(None, extract_main_text, html)
+            if text:
+                await self.page_cache.set(url, text, etag, last_modified)
+            return text
+        except asyncio.TimeoutError:
+            return "(無法擷取內容: 連線逾時)"
+        except Exception as e:
+            return f"(無法擷取內容: {e})"
+
+    async def map_reduce_summary(self, text, question):
+        """將超長正文分塊後平行交給 LLM 摘要，再依原順序合併"""
+        chunks = split_chunks(text, PAGE_CHUNK_TOKENS)[:PAGE_MAX_CHUNKS]
+        focus = f"請著重與「{question}」相關的內容，" if question else ""
+        prompts = [
+            f"以下是一個網頁的第 {i + 1}/{len(chunks)} 段內容。{focus}"
+            f"請用繁體中文條列摘要其中的重點事實、數據與日期，不要加入原文沒有的資訊：\n\n{chunk}"
+            for i, chunk in enumerate(chunks)
+        ]
+        # 不沿用外層 agent 的 callbacks，避免分塊摘要被當成回答串流到 Discord
+        results = await asyncio.gather(
+            *(self.llm.ainvoke(prompt, config={"callbacks": []}) for prompt in prompts), return_exceptions=True
+        )
+        summaries = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                # 摘要失敗的區塊保留原文，交由後續的 token 上限截斷
+                summaries.append(chunk)
+            else:
+                summaries.append(result.content if hasattr(result, "content") else str(result))
+        return "\n".join(summaries)
 
-        url_pattern = re.compile(r"https?://[^\s]+")
-        urls_in_query = url_pattern.findall(query)
+    async def page_digest(self, url, question="", budget=PAGE_TOKEN_BUDGET, map_reduce=False):
+        """取得網頁正文，依與問題的相關性挑選段落並控制在 budget 個 token 內"""
+        text = await self.fetch_page_text(url)
+        if not text or text.startswith("(無法擷取內容"):
+            return text
+        if map_reduce and PAGE_MAP_REDUCE and estimate_tokens(text) > budget * 2:
+            text = await self.map_reduce_summary(text, question)
+        return fit_to_budget(text, question, budget)
+
+    async def summarize_url(self, query: str = "") -> str:
+        key = ("summarize_url", normalize_text(query))
+        return await self.tool_flight.do(key, lambda: self._summarize_url(query), cacheable=is_cacheable_result)
+
+    async def _summarize_url(self, query):
+        """
+        摘要網址內容。參數可以是網址，或是'問題+網址'，會回傳該網址的網頁摘要，若有問題會一併附上。
+        """
+        urls_in_query = URL_PATTERN.findall(query)
         result_parts = []
         if urls_in_query:
-            for url_ in urls_in_query:
-                text = extract_text_from_url(url_)
+            question_part = URL_PATTERN.sub("", query).strip()
+            budget = max(1, PAGE_TOKEN_BUDGET // len(urls_in_query))
+            texts = await asyncio.gather(*(
+                self.page_digest(url_, question_part, budget, map_reduce=True) for url_ in urls_in_query
+            ))
+            for url_, text in zip(urls_in_query, texts):
                 if text and not text.startswith("(無法擷取內容"):
-                    # 不限制字數，直接回傳全部正文
                     result_parts.append(f"{url_}\n【網頁摘要】{text}")
                 else:
                     result_parts.append(f"{url_}\n{text}")
-            question_part = url_pattern.sub("", query).strip()
             if question_part:
                 result_parts.insert(0, f"【原始問題】{question_part}")
             return "\n\n".join(result_parts)
         else:
             return "請提供網址，或是'問題+網址'。"
 
-    @staticmethod
-    def search_web(query: str = "") -> str:
+    async def search_web(self, query: str = "") -> str:
+        key = ("search_web", normalize_text(query))
+        return await self.tool_flight.do(key, lambda: self._search_web(query), cacheable=is_cacheable_result)
+
+    async def _search_web(self, query):
         """
         使用 Google 搜尋，參數為查詢關鍵字，回傳前幾條摘要，並自動進入網站抓取正文摘要。
-        搜尋到的網址會傳遞給 summarize_url 進行文字擷取，並傳到 LLM 分析。
+        各網頁正文依與查詢的相關性挑選段落，合計不超過 SEARCH_TOKEN_BUDGET 個 token。
         """
         if not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
             return "未設定 GOOGLE_API_KEY 或 GOOGLE_CSE_ID，無法搜尋。"
@@ -201,27 +479,117 @@ class LlmChatCog(commands.Cog):
             "hl": "zh-TW"
         }
         try:
-            resp = requests.get(url, params=params, timeout=10)
-            if resp.status_code != 200:
-                return f"搜尋失敗，狀態碼：{resp.status_code}"
-            data = resp.json()
-            items = data.get("items", [])
+            async with self.http.get(url, params=params) as resp:
+                if resp.status != 200:
+                    return f"搜尋失敗，狀態碼：{resp.status}"
+                data = await resp.json()
+            items = [item for item in data.get("items", []) if item.get("link")]
             if not items:
                 return "未找到相關結果。"
+            # 同時抓取所有網頁，超過 SEARCH_DEADLINE 仍未完成的直接取消
+            budget = max(1, SEARCH_TOKEN_BUDGET // len(items))
+            fetches = [asyncio.create_task(self.page_digest(item["link"], query, budget)) for item in items]
+            _, pending = await asyncio.wait(fetches, timeout=SEARCH_DEADLINE)
+            for task in pending:
+                task.cancel()
             snippets = []
-            for item in items:
+            for item, task in zip(items, fetches):
                 title = item.get("title", "")
                 desc = item.get("snippet", "")
-                url_ = item.get("link", "")
-                if url_:
-                    # 使用 summarize_url 擷取文字
-                    summary = LlmChatCog.summarize_url(url_)
-                    snippets.append(f"{title}\n{desc}\n{url_}\n【網頁摘要】{summary}")
+                url_ = item["link"]
+                if task in pending:
+                    summary = "(無法擷取內容: 超過搜尋時間上限)"
+                elif task.exception():
+                    summary = f"(無法擷取內容: {task.exception()})"
+                else:
+                    summary = task.result()
+                snippets.append(f"{title}\n{desc}\n{url_}\n【網頁摘要】{summary}")
             result_text = "\n\n".join(snippets)
             return result_text
         except Exception as e:
             return f"搜尋時發生錯誤：{str(e)}"
 
+    def schedule_compaction(self, conversation_key):
+        """在背景將移出歷史的舊對話併入摘要，不阻塞回覆"""
+        conversation = self.conversations.get(conversation_key)
+        if not conversation.pending or conversation.compacting:
+            return
+        # 在建立 Task 前標記，同一輪事件迴圈中結束的兩次回覆不會各自啟動壓縮
+        conversation.compacting = True
+        task = asyncio.create_task(self.compact_conversation(conversation))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def compact_conversation(self, conversation):
+        try:
+            while conversation.pending:
+                # 每輪最多處理約四倍摘要長度的舊對話，其餘與壓縮期間新移出的訊息留待下一輪
+                dropped = conversation.take_pending(CHAT_SUMMARY_TOKENS * 4)
+                if not dropped:
+                    break
+                transcript = "\n".join(
+                    f"{'使用者' if m['role'] == 'user' else '助手'}：{m['content']}" for m in dropped
+                )
+                prompt = (
+                    f"請將「既有摘要」與「新對話」整合成一段新的繁體中文對話摘要，"
+                    f"保留人名、偏好、待辦事項與重要結論，不超過 {CHAT_SUMMARY_TOKENS} 字，只輸出摘要本身。\n\n"
+                    f"既有摘要：{conversation.summary or '（無）'}\n\n新對話：\n{transcript}"
+                )
+                async with self._summary_limit:
+                    result = await self.llm.ainvoke(prompt)
+                summary = result.content if hasattr(result, "content") else str(result)
+                conversation.summary = truncate_tokens(summary.strip(), CHAT_SUMMARY_TOKENS)
+        except Exception as e:
+            print(f"壓縮對話摘要時發生錯誤: {str(e)}")
+        finally:
+            conversation.compacting = False
+
+    async def run_music_command(self, message, cmd_line):
+        """執行 '!play 歌名' 這類音樂指令，回傳是否已處理"""
+        cmd_line = cmd_line.replace('`', '').replace('\n', '').strip()
+        match = MUSIC_COMMAND_PATTERN.match(cmd_line)
+        if not match:
+            return False
+        command_name = match.group(1).lower()
+        arg_str = match.group(2).strip()
+        command = self.bot.get_command(command_name)
+        if not command:
+            await message.channel.send(f"❌ 找不到指令 `{command_name}`，請確認。")
+            return True
+        if message.guild is None:
+            await message.channel.send("❌ 音樂指令只能在伺服器中使用！")
+            return True
+        ctx = await self.bot.get_context(message)
+        # ctx.invoke 不會執行檢查與前置 hook，這裡補上 Music 的 cog_check 與 cog_before_invoke
+        ctx.command = command
+        try:
+            if not await command.can_run(ctx):
+                raise commands.CheckFailure("無法執行此指令")
+        except commands.CommandError as e:
+            await message.channel.send(f"❌ {str(e)}")
+            return True
+        await command.call_before_hooks(ctx)
+        play_params = list(inspect.signature(command.callback).parameters)
+        if command_name == "play" and arg_str:
+            if "query" in play_params:
+                await ctx.invoke(command, query=arg_str)
+            else:
+                await ctx.invoke(command, arg_str)
+        else:
+            await ctx.invoke(command)
+        return True
+
+    async def handle_fast_intent(self, message, content):
+        """明確的音樂與時間指令直接執行，不經過 agent；回傳是否已處理"""
+        intent = match_intent(content)
+        if intent is None:
+            return False
+        command_name, arg = intent
+        if command_name == "time":
+            await message.channel.send(self.get_time())
+            return True
+        return await self.run_music_command(message, f"!{command_name} {arg}".strip())
+
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author == self.bot.user:
@@ -230,70 +598,59 @@ class LlmChatCog(commands.Cog):
             content = message.content.replace(f'<@{self.bot.user.id}>', '').strip()
             
             # 檢查是否有圖片附件
-            image_url = None
-            if message.attachments:
-                for attachment in message.attachments:
-                    if attachment.content_type and attachment.content_type.startswith("image/"):
-                        image_url = attachment.url
-                        break  # 只處理第一張圖片
+            images = [
+                attachment for attachment in message.attachments
+                if attachment.content_type and attachment.content_type.startswith("image/")
+            ][:IMAGE_MAX_COUNT]
+
+            # 明確的指令走捷徑，省去 LLM 往返
+            if not images:
+                try:
+                    if await self.handle_fast_intent(message, content):
+                        return
+                except Exception as e:
+                    await message.channel.send(f"❌ 執行指令時發生錯誤：{str(e)}")
+                    return
 
+            conversation_key = self.conversations.key(message)
+            from utils.streaming import DiscordStreamWriter, FinalAnswerStreamHandler
             loop = asyncio.get_event_loop()
+            writer = DiscordStreamWriter(message.channel, interval=STREAM_EDIT_INTERVAL)
+            # ReAct agent 的回答在 "AI:" 之後；原生工具呼叫與 vision 直接輸出回答
+            handler = FinalAnswerStreamHandler(writer, loop, prefix="AI:" if AGENT_MODE == "react" and not images else None)
+            config = {"callbacks": [handler]} if LLM_STREAMING else {}
+            if LLM_STREAMING:
+                writer.start()
             try:
                 async with message.channel.typing():
                     # 若有圖片，直接 vision
-                    if image_url:
-                        messages = [
-                            {"role": "system", "content": "你是一個能夠理解圖片內容的 Discord 助手，請根據用戶的訊息和圖片進行回覆。"},
-                            {"role": "user", "content": [
-                                {"type": "text", "text": content},
-                                {"type": "image_url", "image_url": {"url": image_url}}
-                            ]}
-                        ]
-                        result = await loop.run_in_executor(
-                            None, lambda: self.llm.invoke(messages)
-                        )
-                        response = result.content if hasattr(result, "content") else str(result)
-                        self.chat_history.append({"role": "user", "content": messages[1]["content"]})
-                        self.chat_history.append({"role": "assistant", "content": response})
-                    # 3. 其他走 agent 工具鏈
+                    if images:
+                        response = await self.vision_reply(message, conversation_key, content, images, config)
+                        tool_context = ToolContext()
+                    # 3. 其他走 agent 工具鏈，同一對話中相同的問題合併為一次執行
                     else:
-                        result = await loop.run_in_executor(
-                            None, lambda: self.agent.invoke({"input": content, "chat_history": self.chat_history})
+                        response, tool_context = await self.prompt_flight.do(
+                            (conversation_key, normalize_text(content)),
+                            lambda: self.agent_reply(message, conversation_key, content, config),
+                            cacheable=lambda result: not result[1].music_commands,
                         )
-                        response = result["output"] if isinstance(result, dict) and "output" in result else str(result)
-                        self.chat_history.append({"role": "user", "content": content})
-                        self.chat_history.append({"role": "assistant", "content": response})
-                    if len(self.chat_history) > 20:
-                        self.chat_history = self.chat_history[-20:]
                 executed = False
-                # 自動執行音樂指令
-                if self.last_music_command:
-                    import re, inspect
-                    cmd_line = self.last_music_command.replace('`', '').replace('\n', '').strip()
-                    match = re.match(r"!(play|skip|pause|resume|leave|join)\b\s*(.*)", cmd_line, re.IGNORECASE)
-                    if match:
-                        command_name = match.group(1).lower()
-                        arg_str = match.group(2).strip()
-                        command = self.bot.get_command(command_name)
-                        if command:
-                            ctx = await self.bot.get_context(message)
-                            play_params = list(inspect.signature(command.callback).parameters)
-                            if command_name == "play" and arg_str:
-                                if "query" in play_params:
-                                    await ctx.invoke(command, query=arg_str)
-                                else:
-                                    await ctx.invoke(command, arg_str)
-                            else:
-                                await ctx.invoke(command)
-                            executed = True
-                        else:
-                            await message.channel.send(f"❌ 找不到指令 `{command_name}`，請確認。")
-                            executed = True
-                    self.last_music_command = None
+                # 依序執行這次 agent 產生的音樂指令（共用結果時只執行一次）
+                if tool_context.claim():
+                    for cmd_line in tool_context.music_commands:
+                        executed = await self.run_music_command(message, cmd_line) or executed
                 
-                if not executed:
-                    await message.channel.send(response)
+                if writer.started or not executed:
+                    # 以完整回答覆蓋串流內容；未開始串流時直接發送
+                    await writer.finish(response)
+                else:
+                    await writer.finish()
+                self.schedule_compaction(conversation_key)
+            except SchedulerBusyError as e:
+                await writer.finish()
+                await message.channel.send(f"⏳ {str(e)}")
             except Exception as e:
+                await writer.finish()
                 await message.channel.send(f"❌ Agent 發生錯誤：{str(e)}")
             return  # 已處理完 @mention，不需要繼續處理指令
         await self.bot.process_commands(message)
@@ -1,17 +1,457 @@
+import os
+import re
+import time
+import random
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import yt_dlp
-from collections import deque
+from collections import namedtuple
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
+from utils.cache import TTLCache
+from utils.text import normalize_text
+from utils.play_history import PlayHistory
+
+# yt-dlp 解析執行緒池設定
+YTDL_WORKERS = int(os.getenv('YTDL_WORKERS', '4'))
+YTDL_MAX_PENDING = int(os.getenv('YTDL_MAX_PENDING', '16'))
+YTDL_TIMEOUT = float(os.getenv('YTDL_TIMEOUT', '30'))
+# 閒置多久（秒）後自動離開語音頻道並釋放該伺服器的播放狀態
+MUSIC_IDLE_TIMEOUT = int(os.getenv('MUSIC_IDLE_TIMEOUT', '300'))
+# 播放時預先解析隊列前幾首歌曲的音訊串流
+MUSIC_PREFETCH = int(os.getenv('MUSIC_PREFETCH', '2'))
+# 搜索結果與音訊串流網址快取
+MUSIC_CACHE_SIZE = int(os.getenv('MUSIC_CACHE_SIZE', '2048'))
+MUSIC_CACHE_FILE = os.getenv('MUSIC_CACHE_FILE') or None
+MUSIC_SEARCH_TTL = int(os.getenv('MUSIC_SEARCH_TTL', '86400'))
+# YouTube 簽名串流網址約 6 小時失效，快取必須在此之前過期
+MUSIC_STREAM_TTL = int(os.getenv('MUSIC_STREAM_TTL', '14400'))
+STREAM_EXPIRY_MARGIN = 600
+# 等待表情符號選擇的搜索結果：最多保留幾則訊息、保留多久（秒）
+MUSIC_PENDING_SEARCHES = int(os.getenv('MUSIC_PENDING_SEARCHES', '500'))
+MUSIC_PENDING_SEARCH_TTL = int(os.getenv('MUSIC_PENDING_SEARCH_TTL', '300'))
+# !queue 每頁顯示的歌曲數
+MUSIC_QUEUE_PAGE_SIZE = int(os.getenv('MUSIC_QUEUE_PAGE_SIZE', '10'))
+# 自動推薦使用的本地播放紀錄（SQLite），留空則只保存在記憶體中
+MUSIC_HISTORY_DB = os.getenv('MUSIC_HISTORY_DB', 'music_history.db') or ':memory:'
+# 每個伺服器保留的播放紀錄筆數，以及自動推薦時排除最近播放過的幾筆
+MUSIC_HISTORY_LIMIT = int(os.getenv('MUSIC_HISTORY_LIMIT', '5000'))
+MUSIC_RECENT_WINDOW = int(os.getenv('MUSIC_RECENT_WINDOW', '50'))
+# 自動推薦連續幾首無法播放時停止
+MUSIC_AUTOPLAY_MAX_FAILURES = int(os.getenv('MUSIC_AUTOPLAY_MAX_FAILURES', '3'))
+# 播放清單最多加入幾首歌曲，清單內容快取的秒數
+MUSIC_PLAYLIST_LIMIT = int(os.getenv('MUSIC_PLAYLIST_LIMIT', '200'))
+MUSIC_PLAYLIST_TTL = int(os.getenv('MUSIC_PLAYLIST_TTL', '3600'))
+# 播放管線：opus 在來源已是 Opus 且音量為 100% 時直接轉送 Opus 封包，其餘由 FFmpeg 在解碼時調整音量；
+# pcm 為舊的做法（FFmpeg 解碼為 PCM，Python 逐幀調整音量後再編碼）
+MUSIC_AUDIO_MODE = os.getenv('MUSIC_AUDIO_MODE', 'opus').lower()
+# 預設音量（%）；opus 模式下只有 100% 能直接轉送，其他音量仍需解碼與重新編碼
+MUSIC_DEFAULT_VOLUME = int(os.getenv('MUSIC_DEFAULT_VOLUME', '50'))
+
+YOUTUBE_ID_PATTERN = re.compile(
+    r'(?:youtu\.be/|youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/))([\w-]{11})'
+)
+PLAYLIST_ID_PATTERN = re.compile(r'youtube\.com/playlist\?(?:.*&)?list=([\w-]+)')
+STREAM_EXPIRE_PATTERN = re.compile(r'[?&/]expire[=/](\d+)')
+
+YTDL_OPTIONS = {
+    'outtmpl': '%(title)s.%(ext)s',
+    'default_search': 'auto',
+    # opus 模式優先選擇 Opus 音軌（YouTube 的 WebM/Opus），可直接轉送不需重新編碼
+    'format': (
+        'bestaudio[acodec=opus]/bestaudio/best' if MUSIC_AUDIO_MODE == 'opus'
+        else 'bestaudio[acodec=aac]/bestaudio/best'
+    ),
+    'extractor_args': {
+        'youtube': {
+            'skip': ['dash', 'hls'],
+            'player_skip': ['webpage']
+        }
+    },
+    'max_downloads': 1,
+    'no_warnings': True,
+    'extract_flat': True,
+    'no_check_certificates': True,
+    # 'ignoreerrors': True,
+    'no_color': True,
+    'no_playlist': True,
+    'no_check_formats': True,
+    'quiet': True,
+    'socket_timeout': 10,
+    'source_address': '0.0.0.0'
+}
+
+# 播放清單只做扁平解析，取得每首歌的 ID 與標題，串流網址等到接近播放時才解析
+PLAYLIST_OPTIONS = {
+    **{key: value for key, value in YTDL_OPTIONS.items() if key not in ('no_playlist', 'max_downloads')},
+    'extract_flat': 'in_playlist',
+    'noplaylist': False,
+    'playlistend': MUSIC_PLAYLIST_LIMIT,
+}
+# 扁平解析時無法播放的項目標題
+UNAVAILABLE_TITLES = {'[Private video]', '[Deleted video]'}
+
+FFMPEG_OPTIONS = {
+    'options': '-vn',
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+}
+
+
+def parse_video_id(url):
+    match = YOUTUBE_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def parse_playlist_id(url):
+    match = PLAYLIST_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def stream_ttl(stream_url):
+    """計算串流網址可快取的秒數，依網址中的 expire 參數提前 STREAM_EXPIRY_MARGIN 秒過期"""
+    ttl = MUSIC_STREAM_TTL
+    match = STREAM_EXPIRE_PATTERN.search(stream_url)
+    if match:
+        ttl = min(ttl, int(match.group(1)) - time.time() - STREAM_EXPIRY_MARGIN)
+    return ttl
+
+
+class PlaybackSource(discord.AudioSource):
+    """包裝實際的音訊來源並記錄已播放的幀數，調整音量時用來從目前位置重新開始"""
+
+    FRAME_SECONDS = 0.02
+
+    def __init__(self, source, start=0.0):
+        self.source = source
+        self.start = start
+        self.frames = 0
+
+    @property
+    def position(self):
+        return self.start + self.frames * self.FRAME_SECONDS
+
+    def read(self):
+        data = self.source.read()
+        if data:
+            self.frames += 1
+        return data
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+
+def create_audio_source(stream_url, codec, volume, start=0.0, mode=None):
+    """依播放管線建立音訊來源，start 為開始播放的秒數
+
+    opus 模式下來源為 Opus 且音量 100% 時以 codec copy 直接轉送；需要調整音量時
+    由 FFmpeg 的 volume 濾鏡在解碼時處理，Python 端不再逐幀調整音量，
+    Opus 編碼仍交給 discord.py（實測比 FFmpeg 的 libopus 編碼省 CPU，見 benchmarks/audio_pipeline.py）。
+    """
+    mode = mode or MUSIC_AUDIO_MODE
+    before_options = FFMPEG_OPTIONS['before_options']
+    if start:
+        before_options += f' -ss {start:.2f}'
+    options = FFMPEG_OPTIONS['options']
+    if mode == 'pcm':
+        source = discord.PCMVolumeTransformer(
+            discord.FFmpegPCMAudio(stream_url, before_options=before_options, options=options), volume=volume
+        )
+    elif codec == 'opus' and abs(volume - 1.0) < 1e-6:
+        source = discord.FFmpegOpusAudio(stream_url, codec='opus', before_options=before_options, options=options)
+    else:
+        source = discord.FFmpegPCMAudio(
+            stream_url, before_options=before_options, options=f'{options} -af volume={volume:.2f}'
+        )
+    return PlaybackSource(source, start)
+
+
+# 表情符號選歌只需要的精簡資訊
+SearchEntry = namedtuple('SearchEntry', ['id', 'title', 'duration'])
+
+
+class ExtractorBusyError(Exception):
+    """解析佇列已滿，呼叫端應請使用者稍後再試"""
+
+
+class YTDLExtractor:
+    """在獨立的執行緒池中執行 yt-dlp 解析，避免阻塞事件迴圈
+
+    同時執行的解析數量受 workers 限制，另外最多允許 max_pending 個請求排隊等待，
+    超過時直接拋出 ExtractorBusyError；每次解析都有 timeout 秒的時間上限。
+    """
+
+    def __init__(self, workers=YTDL_WORKERS, max_pending=YTDL_MAX_PENDING, timeout=YTDL_TIMEOUT):
+        self.workers = max(1, workers)
+        self.max_pending = max(0, max_pending)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ytdl')
+        self._inflight = 0
+
+    @property
+    def capacity(self):
+        return self.workers + self.max_pending
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    @staticmethod
+    def _extract(query, ydl_opts):
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            return ydl.extract_info(query, download=False)
+
+    def _release(self):
+        self._inflight -= 1
+
+    async def extract(self, query, ydl_opts):
+        """在執行緒池中執行 extract_info，逾時拋出 asyncio.TimeoutError"""
+        if self._inflight >= self.capacity:
+            raise ExtractorBusyError("目前解析請求過多，請稍後再試！")
+
+        loop = asyncio.get_running_loop()
+
+        def on_done(_):
+            # 以執行緒實際結束為準釋放名額，逾時的解析仍會佔用名額直到結束
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:
+                pass  # 事件迴圈已關閉
+
+        future = self._executor.submit(self._extract, query, ydl_opts)
+        self._inflight += 1
+        future.add_done_callback(on_done)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class Track:
+    """隊列中的一首歌曲，stream_url 為 None 或已過期表示需要（重新）解析音訊串流
+
+    使用 __slots__ 讓長播放清單的每個項目只佔用少量記憶體；requester 為點歌者的使用者 ID。
+    duration 改變時會同步更新所屬隊列的總長度。
+    """
+
+    __slots__ = (
+        'id', 'title', 'webpage_url', 'stream_url', 'expires_at', '_duration', 'codec', 'requester',
+        'resolving', 'queue',
+    )
+
+    def __init__(self, title, webpage_url, stream_url=None, duration=None, id=None, codec=None, requester=None):
+        self.id = id
+        self.title = title
+        self.webpage_url = webpage_url
+        self.stream_url = stream_url
+        self.expires_at = time.time() + stream_ttl(stream_url) if stream_url else 0.0
+        self._duration = duration
+        self.codec = codec  # 音訊編碼（例如 opus），決定能否直接轉送
+        self.requester = requester
+        self.resolving = None  # 背景預解析的 asyncio.Task
+        self.queue = None  # 所在的 TrackQueue
+
+    @classmethod
+    def from_info(cls, info, requester=None):
+        return cls(
+            title=info.get('title', '未知標題'),
+            webpage_url=info.get('webpage_url') or info.get('original_url'),
+            stream_url=info.get('url'),
+            duration=info.get('duration'),
+            id=info.get('id'),
+            codec=info.get('acodec'),
+            requester=requester,
+        )
+
+    @property
+    def duration(self):
+        return self._duration
+
+    @duration.setter
+    def duration(self, value):
+        if self.queue is not None:
+            self.queue._adjust(self._duration, value)
+        self._duration = value
+
+    @property
+    def resolved(self):
+        """已解析出尚未過期的串流網址"""
+        return self.stream_url is not None and time.time() < self.expires_at
+
+    def set_stream(self, stream_url, codec=None):
+        self.stream_url = stream_url
+        self.codec = codec
+        self.expires_at = time.time() + stream_ttl(stream_url)
+
+    def cancel_resolving(self):
+        if self.resolving and not self.resolving.done():
+            self.resolving.cancel()
+        self.resolving = None
+
+
+class TrackQueue:
+    """以索引存取的播放隊列
+
+    歌曲存放在 list 中，以 _head 標記隊首：取出下一首與插隊到下一首都是 O(1)，
+    依索引讀取為 O(1)，移除與移動只需一次記憶體搬移。總長度在加入與移除時增量維護，
+    長度未知的歌曲另外計數。
+    """
+
+    def __init__(self):
+        self._items = []
+        self._head = 0
+        self.total_duration = 0
+        self.unknown_durations = 0
+
+    def __len__(self):
+        return len(self._items) - self._head
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        return islice(self._items, self._head, None)
+
+    def __getitem__(self, index):
+        return self._items[self._head + self._index(index)]
+
+    def page(self, start, count):
+        """回傳從 start（0 起算）開始的最多 count 首歌曲"""
+        start = self._head + max(start, 0)
+        return self._items[start:start + count]
+
+    def _index(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("隊列索引超出範圍")
+        return index
+
+    def _adjust(self, old, new):
+        self.total_duration += (new or 0) - (old or 0)
+        self.unknown_durations += (new is None) - (old is None)
+
+    def _count(self, track, sign):
+        if track.duration is None:
+            self.unknown_durations += sign
+        else:
+            self.total_duration += sign * track.duration
+
+    def _attach(self, track):
+        track.queue = self
+        self._count(track, 1)
+        return track
+
+    def _detach(self, track):
+        self._count(track, -1)
+        track.queue = None
+        return track
+
+    def _compact(self):
+        # 已取出的空位超過一半時才搬移，攤銷後取出仍為 O(1)
+        if self._head > len(self._items) // 2:
+            del self._items[:self._head]
+            self._head = 0
+
+    def append(self, track):
+        self._items.append(self._attach(track))
+
+    def extend(self, tracks):
+        self._items.extend(self._attach(track) for track in tracks)
+
+    def insert_next(self, track):
+        """插隊到下一首"""
+        self._attach(track)
+        if self._head:
+            self._head -= 1
+            self._items[self._head] = track
+        else:
+            self._items.insert(0, track)
+
+    def popleft(self):
+        if not self:
+            raise IndexError("隊列為空")
+        track = self._items[self._head]
+        self._items[self._head] = None
+        self._head += 1
+        self._compact()
+        return self._detach(track)
+
+    def remove(self, index):
+        """移除並回傳指定位置（0 起算）的歌曲"""
+        return self._detach(self._items.pop(self._head + self._index(index)))
+
+    def move(self, source, destination):
+        """將歌曲從 source 移到 destination（皆為 0 起算）"""
+        track = self._items.pop(self._head + self._index(source))
+        self._items.insert(self._head + min(max(destination, 0), len(self)), track)
+        return track
+
+    def shuffle(self):
+        items = self._items[self._head:]
+        random.shuffle(items)
+        self._items = items
+        self._head = 0
+
+    def clear(self):
+        for track in self:
+            track.queue = None
+            track.cancel_resolving()
+        self._items = []
+        self._head = 0
+        self.total_duration = 0
+        self.unknown_durations = 0
+
+
+class GuildPlayer:
+    """單一伺服器的播放狀態，由 Music.get_player 延遲建立"""
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.queue = TrackQueue()  # 待播放的 Track
+        self.current = None  # 正在播放的 Track
+        self.volume = MUSIC_DEFAULT_VOLUME / 100
+        # 自動推薦開關
+        self.auto_recommend = False
+        self.last_played_id = None  # 上一首開始播放的歌曲，用於記錄共現
+        self.recommendations = []  # 背景預先準備的推薦 Track
+        self.recommending = None  # 記錄播放與準備推薦的 asyncio.Task
+        self.failed_ids = set()  # 無法播放的歌曲，自動推薦時排除
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def idle_for(self):
+        return time.monotonic() - self.last_active
+
+    def clear_recommendations(self):
+        if self.recommending and not self.recommending.done():
+            self.recommending.cancel()
+        self.recommending = None
+        for track in self.recommendations:
+            track.cancel_resolving()
+        self.recommendations = []
+
+    def cleanup(self):
+        self.queue.clear()
+        self.clear_recommendations()
+        self.failed_ids.clear()
+
 
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.queue = deque()
-        self.volume = 0.5  # 默認音量 50%
-        self.search_results = {}  # 用於存儲每個消息ID對應的搜索結果
-        # 自動推薦開關
-        self.auto_recommend = False
+        self.extractor = YTDLExtractor()
+        # search:<關鍵字> -> 搜索結果，video:<影片ID> -> 串流網址及資訊
+        self.cache = TTLCache(maxsize=MUSIC_CACHE_SIZE, ttl=MUSIC_SEARCH_TTL, path=MUSIC_CACHE_FILE)
+        self.players = {}  # guild_id -> GuildPlayer
+        self.history = PlayHistory(MUSIC_HISTORY_DB, max_plays=MUSIC_HISTORY_LIMIT)
+        # 用於存儲每個消息ID對應的搜索結果，未被選擇的結果會過期或被淘汰
+        self.search_results = TTLCache(maxsize=MUSIC_PENDING_SEARCHES, ttl=MUSIC_PENDING_SEARCH_TTL)
         # 預設推薦歌曲列表（備用）
         self.recommend_list = [
             "https://www.youtube.com/watch?v=dQw4w9WgXcQ",  # Rickroll
@@ -20,8 +460,158 @@ class Music(commands.Cog):
             "https://www.youtube.com/watch?v=Zi_XLOBDo_Y",  # Billie Jean
             "https://www.youtube.com/watch?v=9bZkp7q19f0"   # Gangnam Style
         ]
-        # 上一首歌曲標題
-        self.last_song_title = None
+        self.idle_reaper.start()
+
+    async def cog_unload(self):
+        self.idle_reaper.cancel()
+        self.extractor.shutdown()
+        if self.cache.dirty:
+            self.cache.save()
+        self.history.close()
+
+    async def cog_check(self, ctx):
+        if ctx.guild is None and ctx.command.name != 'musichelp':
+            raise commands.NoPrivateMessage("音樂指令只能在伺服器中使用！")
+        return True
+
+    async def cog_before_invoke(self, ctx):
+        player = self.players.get(ctx.guild.id) if ctx.guild else None
+        if player:
+            player.touch()
+
+    def get_player(self, guild_id):
+        """取得伺服器的播放狀態，不存在時建立"""
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id)
+        return player
+
+    def destroy_player(self, guild_id):
+        player = self.players.pop(guild_id, None)
+        if player:
+            player.cleanup()
+
+    def cache_video(self, info):
+        """快取單一影片的串流網址及資訊，回傳精簡後的資訊"""
+        video = {
+            'id': info.get('id'),
+            'title': info.get('title', '未知標題'),
+            'webpage_url': info.get('webpage_url') or info.get('original_url'),
+            'url': info['url'],
+            'duration': info.get('duration'),
+            'acodec': info.get('acodec'),
+        }
+        if video['id']:
+            self.cache.set(f"video:{video['id']}", video, ttl=stream_ttl(video['url']))
+        return video
+
+    async def extract_video(self, url, video_id=None):
+        """取得影片資訊，優先使用快取"""
+        video_id = video_id or parse_video_id(url)
+        if video_id:
+            cached = self.cache.get(f"video:{video_id}")
+            if cached:
+                return cached
+        info = await self.extractor.extract(url, YTDL_OPTIONS)
+        if not info or 'entries' in info or 'url' not in info:
+            return info
+        return self.cache_video(info)
+
+    async def search(self, keywords):
+        """搜尋 YouTube 前五筆結果，優先使用快取"""
+        key = f"search:{normalize_text(keywords)}"
+        entries = self.cache.get(key)
+        if entries is None:
+            info = await self.extractor.extract(f'ytsearch5:{keywords}', YTDL_OPTIONS)
+            if info is None:
+                return None
+            entries = [
+                {'id': entry.get('id'), 'title': entry.get('title', '未知標題'), 'duration': entry.get('duration')}
+                for entry in info.get('entries') or [] if entry and entry.get('id')
+            ]
+            self.cache.set(key, entries, ttl=MUSIC_SEARCH_TTL)
+        return entries
+
+    async def extract_playlist(self, playlist_id):
+        """扁平解析播放清單，只取得每首歌的 ID、標題與長度，優先使用快取"""
+        key = f"playlist:{playlist_id}"
+        playlist = self.cache.get(key)
+        if playlist is None:
+            url = f"https://www.youtube.com/playlist?list={playlist_id}"
+            info = await self.extractor.extract(url, PLAYLIST_OPTIONS)
+            if info is None:
+                return None
+            playlist = {
+                'title': info.get('title') or '播放清單',
+                'entries': [
+                    {'id': entry['id'], 'title': entry.get('title', '未知標題'), 'duration': entry.get('duration')}
+                    for entry in (info.get('entries') or [])[:MUSIC_PLAYLIST_LIMIT]
+                    if entry and entry.get('id') and entry.get('title') not in UNAVAILABLE_TITLES
+                ],
+            }
+            self.cache.set(key, playlist, ttl=MUSIC_PLAYLIST_TTL)
+        return playlist
+
+    async def resolve(self, track):
+        """解析歌曲的音訊串流網址及資訊"""
+        if track.resolved:
+            return track
+        info = await self.extract_video(track.webpage_url, track.id)
+        if not info or 'url' not in info:
+            raise ValueError(f"無法獲取音頻流：{track.title}")
+        track.id = info.get('id', track.id)
+        track.set_stream(info['url'], info.get('acodec'))
+        track.title = info.get('title', track.title)
+        track.duration = info.get('duration', track.duration)
+        return track
+
+    def prefetch(self, player):
+        """在背景預先解析隊列前幾首尚未解析的歌曲"""
+        # 只看隊列最前面的預解析窗口，長播放清單不會一次解析所有歌曲
+        for track in islice(player.queue, MUSIC_PREFETCH):
+            if track.resolved or track.resolving:
+                continue
+            track.resolving = asyncio.create_task(self.resolve(track))
+            # 預解析失敗時留待播放時再重試，這裡只取出例外避免警告
+            track.resolving.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def ensure_resolved(self, track):
+        """等待背景預解析完成；若未預解析或預解析失敗則立即解析"""
+        if track.resolving and not track.resolved:
+            try:
+                await track.resolving
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"預解析歌曲時發生錯誤: {str(e)}")
+        track.resolving = None
+        return await self.resolve(track)
+
+    @tasks.loop(seconds=60)
+    async def idle_reaper(self):
+        """釋放閒置過久的伺服器播放狀態並離開語音頻道"""
+        for guild_id, player in list(self.players.items()):
+            guild = self.bot.get_guild(guild_id)
+            voice_client = guild.voice_client if guild else None
+            if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
+                player.touch()
+                continue
+            if player.idle_for() < MUSIC_IDLE_TIMEOUT:
+                continue
+            if voice_client:
+                try:
+                    await voice_client.disconnect()
+                except Exception as e:
+                    print(f"閒置離開語音頻道時發生錯誤: {str(e)}")
+            self.destroy_player(guild_id)
+        self.search_results.purge()
+        if self.cache.path and self.cache.dirty:
+            # 快照在事件迴圈中取得，執行緒只負責寫檔，不會與其他存取同時修改快取
+            await asyncio.to_thread(self.cache.write, self.cache.snapshot())
+
+    @idle_reaper.before_loop
+    async def before_idle_reaper(self):
+        await self.bot.wait_until_ready()
         
     def format_duration(self, seconds):
         hours = int(seconds // 3600)
@@ -59,8 +649,9 @@ class Music(commands.Cog):
             return
             
         channel_name = ctx.voice_client.channel.name
+        # 先釋放播放狀態，避免斷線觸發的 after 回調繼續播放
+        self.destroy_player(ctx.guild.id)
         await ctx.voice_client.disconnect()
-        self.queue.clear()  # 清空播放隊列
         await ctx.send(f"已離開語音頻道：{channel_name}")
 
     @commands.command()
@@ -79,78 +670,97 @@ class Music(commands.Cog):
         await ctx.send("正在處理您的請求，請稍候...")
 
         try:
-            ydl_opts = {
-                'outtmpl': '%(title)s.%(ext)s',
-                'default_search': 'auto',
-                'format': 'bestaudio[acodec=aac]/bestaudio/best',
-                'extractor_args': {
-                    'youtube': {
-                        'skip': ['dash', 'hls'],
-                        'player_skip': ['webpage']
-                    }
-                },
-                'max_downloads': 1,
-                'no_warnings': True,
-                'extract_flat': True,
-                'no_check_certificates': True,
-                # 'ignoreerrors': True,
-                'no_color': True,
-                'no_playlist': True,
-                'no_check_formats': True,
-                'quiet': True,
-                'source_address': '0.0.0.0'
-            }
+            playlist_id = parse_playlist_id(query)
+            if playlist_id:
+                await self.enqueue_playlist(ctx, playlist_id)
+                return
 
             is_search = not query.startswith(('http://', 'https://', 'www.'))
             if is_search:
-                query = f'ytsearch5:{query}'
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.cache.remove()
-                info = ydl.extract_info(query, download=False)
-                if info is None:
-                    await ctx.send("無法獲取視頻信息，請檢查輸入是否正確。")
-                    return
+                info = await self.search(query)
+                if info is not None:
+                    info = {'entries': info}
+            else:
+                info = await self.extract_video(query)
+            if info is None:
+                await ctx.send("無法獲取視頻信息，請檢查輸入是否正確。")
+                return
 
-                if 'entries' in info:
-                    search_results = []
-                    for i, entry in enumerate(info['entries'], 1):
-                        if entry:
-                            title = entry.get('title', '未知標題')
-                            duration = self.format_duration(entry.get('duration', 0))
-                            search_results.append(f"{i}. {title} ({duration})")
-
-                    result_message = "搜索結果：\n" + "\n".join(search_results)
-                    result_message += "\n\n點擊下方表情符號選擇要播放的歌曲"
-                    
-                    message = await ctx.send(result_message)
-                    self.search_results[str(message.id)] = info['entries']
-                    
-                    number_emojis = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣']
-                    for i in range(min(len(info['entries']), 5)):
-                        await message.add_reaction(number_emojis[i])
-                    return
+            if 'entries' in info:
+                search_results = []
+                for i, entry in enumerate(info['entries'], 1):
+                    if entry:
+                        title = entry.get('title', '未知標題')
+                        duration = self.format_duration(entry.get('duration') or 0)
+                        search_results.append(f"{i}. {title} ({duration})")
 
-                if 'url' not in info:
-                    await ctx.send("無法獲取音頻流，請稍後重試。")
+                if not search_results:
+                    await ctx.send("找不到相關歌曲，請換個關鍵字試試。")
                     return
 
-                title = info.get('title', '未知標題')
-                audio_url = info['url']
+                result_message = "搜索結果：\n" + "\n".join(search_results)
+                result_message += "\n\n點擊下方表情符號選擇要播放的歌曲"
                 
-                self.queue.append((audio_url, title))
+                message = await ctx.send(result_message)
+                entries = [
+                    SearchEntry(entry.get('id'), entry.get('title', '未知標題'), entry.get('duration'))
+                    for entry in info['entries'][:5] if entry
+                ]
+                self.search_results.set(message.id, entries)
+                
+                number_emojis = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣']
+                for i in range(len(entries)):
+                    await message.add_reaction(number_emojis[i])
+                return
 
-                if len(self.queue) == 1:
-                    await self.play_next(ctx)
-                else:
-                    await ctx.send(f"已將 {title} 添加到隊列中！")
+            if 'url' not in info:
+                await ctx.send("無法獲取音頻流，請稍後重試。")
+                return
 
+            track = Track.from_info(info, requester=ctx.author.id)
+            
+            player = self.get_player(ctx.guild.id)
+            player.queue.append(track)
+
+            if player.current is None:
+                await self.play_next(ctx)
+            else:
+                self.prefetch(player)
+                await ctx.send(f"已將 {track.title} 添加到隊列中！")
+
+        except ExtractorBusyError as e:
+            await ctx.send(str(e))
+        except asyncio.TimeoutError:
+            await ctx.send("解析逾時，請稍後重試。")
         except Exception as e:
             print(f"處理請求時發生錯誤: {str(e)}")
             await ctx.send(f"處理請求時發生錯誤：{str(e)}")
 
+    async def enqueue_playlist(self, ctx, playlist_id):
+        """將播放清單的歌曲一次加入隊列，串流網址由預解析在播放前逐首取得"""
+        playlist = await self.extract_playlist(playlist_id)
+        if not playlist or not playlist['entries']:
+            await ctx.send("無法獲取播放清單，或清單中沒有可播放的歌曲。")
+            return
+
+        player = self.get_player(ctx.guild.id)
+        player.queue.extend(
+            Track(
+                entry['title'], f"https://www.youtube.com/watch?v={entry['id']}",
+                duration=entry['duration'], id=entry['id'], requester=ctx.author.id,
+            )
+            for entry in playlist['entries']
+        )
+        await ctx.send(f"已將播放清單 {playlist['title']} 的 {len(playlist['entries'])} 首歌曲添加到隊列中！")
+
+        if player.current is None:
+            await self.play_next(ctx)
+        else:
+            self.prefetch(player)
+
     async def play_next(self, ctx):
-        if not self.queue:
+        player = self.get_player(ctx.guild.id)
+        if not player.queue:
             await ctx.send("隊列已空！")
             return
 
@@ -163,95 +773,191 @@ class Music(commands.Cog):
                 await ctx.send("無法連接到語音頻道，請稍後重試！")
                 return
 
-        try:
-            current_song = self.queue[0]
-            audio_url, title = current_song
+        if not await self.start_next(ctx, player):
+            await self.handle_song_end(ctx)  # 隊列中的歌曲都無法播放，交由自動推薦或結束播放
 
-            # 記錄當前歌曲標題
-            self.last_song_title = title
+    async def start_next(self, ctx, player):
+        """播放隊列中的下一首，無法播放時略過並改播再下一首
 
-            FFMPEG_OPTIONS = {
-                'options': '-vn',
-                'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
-            }
-            
-            audio_source = discord.FFmpegPCMAudio(audio_url, **FFMPEG_OPTIONS)
-            transformed_source = discord.PCMVolumeTransformer(audio_source, volume=self.volume)
-            
-            def after_playing(error):
-                if error:
-                    print(f"播放時發生錯誤: {str(error)}")
-                asyncio.run_coroutine_threadsafe(self.handle_song_end(ctx), self.bot.loop)
+        只有隊列中的歌曲全部無法播放時才回傳 False；不會再呼叫 handle_song_end。
+        """
+        while player.queue:
+            player.current = track = player.queue.popleft()
+            player.touch()
+            try:
+                await self.ensure_resolved(track)
+                if self.players.get(ctx.guild.id) is not player:
+                    return True  # 解析期間已離開語音頻道
+                title = track.title
 
-            ctx.voice_client.play(transformed_source, after=after_playing)
-            await ctx.send(f"正在播放：{title} (音量: {int(self.volume * 100)}%)")
-            
-        except Exception as e:
-            print(f"播放時發生錯誤: {str(e)}")
-            await ctx.send(f"播放時發生錯誤：{str(e)}")
-            if self.queue:
-                self.queue.popleft()
-            await self.handle_song_end(ctx)
+                audio_source = create_audio_source(track.stream_url, track.codec, player.volume)
+
+                def after_playing(error):
+                    if error:
+                        print(f"播放時發生錯誤: {str(error)}")
+                    asyncio.run_coroutine_threadsafe(self.handle_song_end(ctx), self.bot.loop)
+
+                ctx.voice_client.play(audio_source, after=after_playing)
+                self.prefetch(player)
+                self.track_started(player, track)
+                await ctx.send(f"正在播放：{title} (音量: {int(player.volume * 100)}%)")
+                return True
+
+            except Exception as e:
+                print(f"播放時發生錯誤: {str(e)}")
+                if track.id:
+                    player.failed_ids.add(track.id)
+                await ctx.send(f"播放時發生錯誤：{str(e)}")
+        return False
 
     async def handle_song_end(self, ctx):
-        if self.queue:
-            self.queue.popleft()
-        
-        if self.queue:
+        player = self.players.get(ctx.guild.id)
+        if player is None:
+            return  # 已離開語音頻道或閒置釋放
+        previous, player.current = player.current, None
+        player.touch()
+
+        if player.queue:
             await self.play_next(ctx)
+        elif player.auto_recommend and previous:
+            await self.autoplay(ctx, player, previous)
         else:
-            if self.auto_recommend and self.last_song_title:
-                try:
-                    import yt_dlp
-                    ydl_opts = {
-                        'quiet': True,
-                        'skip_download': True,
-                        'extract_flat': 'in_playlist',
-                        'default_search': 'auto',
-                        'noplaylist': True,
-                        'no_warnings': True,
-                    }
-                    query = f"ytsearch5:{self.last_song_title} 相關歌曲"
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info = ydl.extract_info(query, download=False)
-                        entries = info.get('entries', [])
-                        # 選擇第一個不同於上一首的推薦
-                        next_video = None
-                        for entry in entries:
-                            if entry and entry.get('title') != self.last_song_title:
-                                next_video = entry
-                                break
-                        if next_video:
-                            video_url = f"https://www.youtube.com/watch?v={next_video['id']}"
-                            title = next_video.get('title', '推薦歌曲')
-                            self.queue.append((video_url, title))
-                            await ctx.send(f"自動推薦播放：{title}")
-                            await self.play_next(ctx)
-                            return
-                except Exception as e:
-                    print(f"自動推薦時發生錯誤: {str(e)}")
-                    await ctx.send("自動推薦失敗，播放結束！")
-            else:
-                await ctx.send("播放結束！")
+            await ctx.send("播放結束！")
+
+    async def autoplay(self, ctx, player, seed):
+        """播放下一首推薦歌曲；連續 MUSIC_AUTOPLAY_MAX_FAILURES 首無法播放時停止"""
+        for _ in range(MUSIC_AUTOPLAY_MAX_FAILURES):
+            try:
+                track = await self.next_recommendation(player, seed)
+            except Exception as e:
+                print(f"自動推薦時發生錯誤: {str(e)}")
+                break
+            if self.players.get(ctx.guild.id) is not player:
+                return  # 準備推薦期間已離開語音頻道
+            if track is None:
+                await ctx.send("找不到推薦歌曲，播放結束！")
+                return
+            player.queue.append(track)
+            await ctx.send(f"自動推薦播放：{track.title}")
+            if await self.start_next(ctx, player):
+                return
+        await ctx.send("自動推薦失敗，播放結束！")
+
+    def track_started(self, player, track):
+        """歌曲開始播放後在背景記錄播放紀錄；開啟自動推薦且隊列已空時一併準備推薦歌曲"""
+        previous_id, player.last_played_id = player.last_played_id, track.id
+        player.clear_recommendations()
+        player.recommending = asyncio.create_task(self.after_track_started(player, track, previous_id))
+        player.recommending.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def after_track_started(self, player, track, previous_id):
+        if track.id:
+            await asyncio.to_thread(
+                self.history.record, player.guild_id, track.id, track.title, track.duration, previous_id
+            )
+        if player.auto_recommend and not player.queue:
+            await self.prepare_recommendations(player, track)
+
+    async def prepare_recommendations(self, player, seed):
+        """準備自動推薦的歌曲並預先解析第一首
+
+        優先使用本地播放紀錄的共現索引，沒有候選時才遠端搜尋，最後才使用預設推薦列表；
+        最近播放過與曾經無法播放的歌曲都會被排除。
+        """
+        recent = await asyncio.to_thread(self.history.recent_ids, player.guild_id, MUSIC_RECENT_WINDOW)
+        recent |= player.failed_ids
+        recent.add(seed.id)
+        entries = await asyncio.to_thread(self.history.candidates, player.guild_id, seed.id, recent)
+        if not entries:
+            try:
+                results = await self.search(f"{seed.title} 相關歌曲") or []
+            except Exception as e:
+                print(f"搜尋推薦歌曲時發生錯誤: {str(e)}")
+                results = []
+            entries = [entry for entry in results if entry['id'] not in recent and entry['title'] != seed.title]
+        if not entries:
+            entries = [
+                {'id': video_id, 'title': '推薦歌曲', 'duration': None}
+                for video_id in map(parse_video_id, self.recommend_list) if video_id not in recent
+            ]
+            random.shuffle(entries)
+
+        player.recommendations = [
+            Track(
+                entry['title'], f"https://www.youtube.com/watch?v={entry['id']}",
+                duration=entry['duration'], id=entry['id'],
+            )
+            for entry in entries
+        ]
+        if player.recommendations:
+            # 預先解析第一首推薦，播放結束時可直接接上；失敗時留待播放時再重試
+            try:
+                await self.resolve(player.recommendations[0])
+            except Exception as e:
+                print(f"預解析推薦歌曲時發生錯誤: {str(e)}")
+
+    async def next_recommendation(self, player, previous):
+        """取出下一首推薦歌曲，優先使用背景準備好的候選；沒有時立即準備"""
+        task = player.recommending
+        if task and not task.done():
+            try:
+                await task
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise  # 取消的是目前的呼叫而不是背景任務
+            except Exception as e:
+                print(f"準備推薦歌曲時發生錯誤: {str(e)}")
+
+        recent = await asyncio.to_thread(self.history.recent_ids, player.guild_id, MUSIC_RECENT_WINDOW)
+        recent |= player.failed_ids
+        while player.recommendations:
+            track = player.recommendations.pop(0)
+            if track.id not in recent:
+                return track
+        # 播放途中才開啟自動推薦，或候選都已播放過
+        await self.prepare_recommendations(player, previous)
+        return player.recommendations.pop(0) if player.recommendations else None
 
     @commands.command()
     async def volume(self, ctx, vol: float = None):
         """設置音量 (0-200)"""
+        player = self.get_player(ctx.guild.id)
         if vol is None:
-            await ctx.send(f"當前音量：{int(self.volume * 100)}%")
+            await ctx.send(f"當前音量：{int(player.volume * 100)}%")
             return
             
         if not 0 <= vol <= 200:
             await ctx.send("音量必須在 0-200% 之間！")
             return
             
-        self.volume = vol / 100
+        player.volume = vol / 100
         
         if ctx.voice_client and ctx.voice_client.source:
-            ctx.voice_client.source.volume = self.volume
-            
+            self.apply_volume(ctx.voice_client, player)
+
         await ctx.send(f"音量已設置為 {int(vol)}%")
 
+    def apply_volume(self, voice_client, player):
+        """將音量套用到正在播放的來源
+
+        pcm 模式直接調整 PCMVolumeTransformer；opus 模式由 FFmpeg 處理音量，
+        因此從目前播放位置以新音量重新建立來源並替換。
+        """
+        source = voice_client.source
+        if not isinstance(source, PlaybackSource) or player.current is None:
+            return
+        if isinstance(source.source, discord.PCMVolumeTransformer):
+            source.source.volume = player.volume
+            return
+        track = player.current
+        # 替換來源時 discord.py 會暫停後再恢復播放，原本已暫停的歌曲需要再暫停一次
+        paused = voice_client.is_paused()
+        voice_client.source = create_audio_source(track.stream_url, track.codec, player.volume, start=source.position)
+        if paused:
+            voice_client.pause()
+        # 播放執行緒可能仍在讀取舊來源，稍後再結束舊的 FFmpeg 避免被當成播放結束
+        self.bot.loop.call_later(1, source.cleanup)
+
     @commands.command()
     async def skip(self, ctx):
         """跳過當前歌曲"""
@@ -266,20 +972,126 @@ class Music(commands.Cog):
         ctx.voice_client.stop()
         await ctx.send("已跳過當前歌曲！")
 
+    def format_track(self, track):
+        """隊列中單首歌曲的顯示文字：標題、長度與點歌者"""
+        title = track.title if len(track.title) <= 80 else track.title[:79] + "…"
+        duration = self.format_duration(track.duration) if track.duration else "--:--"
+        requester = f" - <@{track.requester}>" if track.requester else ""
+        return f"{title} ({duration}){requester}"
+
     @commands.command(name='queue')
-    async def queue_list(self, ctx):
-        """查看播放隊列"""
-        if not self.queue:
+    async def queue_list(self, ctx, page: int = 1):
+        """查看播放隊列（分頁顯示）"""
+        player = self.players.get(ctx.guild.id)
+        if not player or (not player.queue and not player.current):
             await ctx.send("隊列為空！")
             return
-        
-        queue_list = "\n".join([f"{i+1}. {title}" for i, (_, title) in enumerate(self.queue)])
-        await ctx.send(f"當前隊列：\n{queue_list}")
+
+        queue = player.queue
+        pages = max(1, -(-len(queue) // MUSIC_QUEUE_PAGE_SIZE))
+        page = min(max(page, 1), pages)
+        # 剩餘總長度：隊列總長度為增量維護，再加上正在播放歌曲的剩餘時間
+        remaining = queue.total_duration
+
+        lines = []
+        if player.current:
+            source = ctx.voice_client.source if ctx.voice_client else None
+            position = source.position if isinstance(source, PlaybackSource) else 0
+            if player.current.duration:
+                remaining += max(player.current.duration - position, 0)
+            lines.append(f"正在播放：{self.format_track(player.current)}")
+        if queue:
+            start = (page - 1) * MUSIC_QUEUE_PAGE_SIZE
+            lines.append("當前隊列：")
+            lines.extend(
+                f"{index}. {self.format_track(track)}"
+                for index, track in enumerate(queue.page(start, MUSIC_QUEUE_PAGE_SIZE), start + 1)
+            )
+        footer = f"第 {page}/{pages} 頁，共 {len(queue)} 首，剩餘總長度 {self.format_duration(remaining)}"
+        if queue.unknown_durations:
+            footer += f"（另有 {queue.unknown_durations} 首長度未知）"
+        lines.append(footer)
+        # 點歌者只顯示名稱，不通知
+        await ctx.send("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
+
+    @commands.command()
+    async def playnext(self, ctx, *, query):
+        """將歌曲插隊到下一首播放"""
+        player = self.players.get(ctx.guild.id)
+        if not player or player.current is None:
+            # 沒有正在播放的歌曲時與 play 相同
+            await self.play(ctx, query=query)
+            return
+
+        try:
+            if query.startswith(('http://', 'https://', 'www.')):
+                info = await self.extract_video(query)
+                if not info or 'url' not in info:
+                    await ctx.send("無法獲取音頻流，請稍後重試。")
+                    return
+                track = Track.from_info(info, requester=ctx.author.id)
+            else:
+                # 關鍵字直接使用第一個搜尋結果，串流網址由預解析取得
+                entries = await self.search(query)
+                if not entries:
+                    await ctx.send("找不到相關歌曲，請換個關鍵字試試。")
+                    return
+                entry = entries[0]
+                track = Track(
+                    entry['title'], f"https://www.youtube.com/watch?v={entry['id']}",
+                    duration=entry['duration'], id=entry['id'], requester=ctx.author.id,
+                )
+            player.queue.insert_next(track)
+            self.prefetch(player)
+            await ctx.send(f"已將 {track.title} 插隊到下一首！")
+        except ExtractorBusyError as e:
+            await ctx.send(str(e))
+        except asyncio.TimeoutError:
+            await ctx.send("解析逾時，請稍後重試。")
+        except Exception as e:
+            print(f"處理請求時發生錯誤: {str(e)}")
+            await ctx.send(f"處理請求時發生錯誤：{str(e)}")
+
+    @commands.command()
+    async def remove(self, ctx, index: int):
+        """從隊列中移除指定編號的歌曲"""
+        player = self.players.get(ctx.guild.id)
+        if not player or not 1 <= index <= len(player.queue):
+            await ctx.send("無效的隊列編號！")
+            return
+        track = player.queue.remove(index - 1)
+        track.cancel_resolving()
+        self.prefetch(player)
+        await ctx.send(f"已從隊列移除：{track.title}")
+
+    @commands.command()
+    async def move(self, ctx, source: int, destination: int):
+        """將隊列中的歌曲移到指定位置"""
+        player = self.players.get(ctx.guild.id)
+        if not player or not 1 <= source <= len(player.queue) or not 1 <= destination <= len(player.queue):
+            await ctx.send("無效的隊列編號！")
+            return
+        track = player.queue.move(source - 1, destination - 1)
+        self.prefetch(player)
+        await ctx.send(f"已將 {track.title} 移到第 {destination} 首")
+
+    @commands.command()
+    async def shuffle(self, ctx):
+        """隨機打亂播放隊列"""
+        player = self.players.get(ctx.guild.id)
+        if not player or len(player.queue) < 2:
+            await ctx.send("隊列中的歌曲不足，無法隨機排序！")
+            return
+        player.queue.shuffle()
+        self.prefetch(player)
+        await ctx.send(f"已隨機排序 {len(player.queue)} 首歌曲！")
 
     @commands.command()
     async def clear(self, ctx):
         """清空播放隊列"""
-        self.queue.clear()
+        player = self.players.get(ctx.guild.id)
+        if player:
+            player.cleanup()
         await ctx.send("已清空隊列！")
 
     @commands.command()
@@ -323,21 +1135,20 @@ class Music(commands.Cog):
             return
 
         # 檢查這個消息是否有相關的搜索結果
-        message_id = str(reaction.message.id)
-        if message_id not in self.search_results:
+        message_id = reaction.message.id
+        search_results = self.search_results.get(message_id)
+        if search_results is None:
             return
 
-        # 獲取選擇的索引和搜索結果
-        index = number_emojis.index(str(reaction.emoji))
-        search_results = self.search_results[message_id]
-
         # 檢查索引是否有效
+        index = number_emojis.index(str(reaction.emoji))
         if not 0 <= index < len(search_results):
             return
 
-        # 獲取選中的視頻信息
+        # 獲取選中的視頻信息，並立即清理搜索結果避免重複選擇
         selected_video = search_results[index]
-        if not selected_video:
+        self.search_results.pop(message_id)
+        if not selected_video.id:
             return
 
         # 創建一個新的上下文來執行播放命令
@@ -345,12 +1156,9 @@ class Music(commands.Cog):
         ctx.author = user  # 設置命令執行者為反應的用戶
 
         # 使用視頻 URL 播放
-        video_url = f"https://youtu.be/{selected_video['id']}"
+        video_url = f"https://youtu.be/{selected_video.id}"
         await self.play(ctx, query=video_url)
 
-        # 清理搜索結果
-        del self.search_results[message_id]
-
     @commands.command()
     async def musichelp(self, ctx):
         """顯示音樂機器人的所有可用指令"""
@@ -362,7 +1170,7 @@ class Music(commands.Cog):
 
         commands_info = {
             "基本指令": {
-                "play <歌曲名稱或URL>": "播放音樂或將歌曲加入隊列",
+                "play <歌曲名稱或URL>": "播放音樂或將歌曲加入隊列，支援 YouTube 播放清單",
                 "join": "加入你當前的語音頻道",
                 "leave": "離開語音頻道並清空隊列"
             },
@@ -370,11 +1178,15 @@ class Music(commands.Cog):
                 "pause": "暫停當前播放",
                 "resume": "恢復播放",
                 "skip": "跳過當前歌曲",
-                "volume <0-200>": "調整音量（預設50%）",
+                "volume <0-200>": f"調整音量（預設{MUSIC_DEFAULT_VOLUME}%）",
                 "volume": "查看當前音量"
             },
             "隊列管理": {
-                "queue": "顯示當前播放隊列",
+                "queue [頁碼]": "分頁顯示當前播放隊列與剩餘總長度",
+                "playnext <歌曲名稱或URL>": "將歌曲插隊到下一首",
+                "remove <編號>": "從隊列中移除指定歌曲",
+                "move <編號> <位置>": "將歌曲移到隊列中的指定位置",
+                "shuffle": "隨機打亂播放隊列",
                 "clear": "清空播放隊列"
             }
         }
@@ -387,19 +1199,38 @@ class Music(commands.Cog):
         
         await ctx.send(embed=embed)
 
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def musicstats(self, ctx):
+        """查看音樂模組的快取統計（僅管理員可用）"""
+        lines = [f"播放中的伺服器：{len(self.players)}"]
+        for name, cache in (("待選搜索結果", self.search_results), ("搜索/串流快取", self.cache)):
+            stats = cache.stats()
+            lines.append(
+                f"{name}：{stats['size']}/{stats['maxsize']} 項，命中 {stats['hits']}，未命中 {stats['misses']}，"
+                f"淘汰 {stats['evictions']}，過期 {stats['expirations']}"
+            )
+        await ctx.send("\n".join(lines))
+
     @commands.command()
     async def autorec(self, ctx, mode: str = None):
         """開啟或關閉自動推薦播放 (用法: !autorec on/off)"""
+        player = self.get_player(ctx.guild.id)
         if mode is None:
-            status = "開啟" if self.auto_recommend else "關閉"
+            status = "開啟" if player.auto_recommend else "關閉"
             await ctx.send(f"自動推薦目前狀態：{status}")
             return
         mode = mode.lower()
         if mode in ["on", "開", "開啟"]:
-            self.auto_recommend = True
+            player.auto_recommend = True
+            # 正在播放時立即在背景準備推薦
+            busy = player.recommending and not player.recommending.done()
+            if player.current and not player.queue and not player.recommendations and not busy:
+                player.recommending = asyncio.create_task(self.prepare_recommendations(player, player.current))
+                player.recommending.add_done_callback(lambda t: t.cancelled() or t.exception())
             await ctx.send("已開啟自動推薦播放！")
         elif mode in ["off", "關", "關閉"]:
-            self.auto_recommend = False
+            player.auto_recommend = False
             await ctx.send("已關閉自動推薦播放！")
         else:
             await ctx.send("請輸入 on/off 來開啟或關閉自動推薦。")
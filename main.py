@@ -1,9 +1,12 @@
 import os
+import time
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import certifi
 
+STARTED_AT = time.perf_counter()
+
 # 加載環境變量
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
@@ -11,29 +14,87 @@ TOKEN = os.getenv('DISCORD_TOKEN')
 # 設置證書路徑
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
+# 分片模式：auto 使用 AutoShardedBot 在同一個行程中處理所有分片，off 為單一連線
+BOT_SHARDING = os.getenv('BOT_SHARDING', 'off').lower()
+# 分片總數與本行程負責的分片（逗號分隔），留空則由 Discord 建議
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+SHARD_IDS = [int(i) for i in os.getenv('SHARD_IDS', '').split(',') if i.strip()] or None
+# 額外開啟的 Gateway 意圖（逗號分隔，例如 members,presences），預設只開啟各模組用到的意圖
+EXTRA_INTENTS = [name.strip() for name in os.getenv('DISCORD_INTENTS', '').split(',') if name.strip()]
+# 成員快取：預設只快取在語音頻道中的成員（音樂模組用來判斷使用者所在頻道）
+MEMBER_CACHE = [name.strip() for name in os.getenv('DISCORD_MEMBER_CACHE', 'voice').split(',') if name.strip()]
+
+def build_intents():
+    """只開啟必要的意圖：伺服器、訊息與內容、表情反應（選歌）、語音狀態"""
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.message_content = True
+    intents.guild_reactions = True
+    intents.voice_states = True
+    for name in EXTRA_INTENTS:
+        if name not in discord.Intents.VALID_FLAGS:
+            raise ValueError(f'未知的意圖: {name}')
+        setattr(intents, name, True)
+    return intents
+
+def build_member_cache_flags():
+    """依設定建立成員快取策略；需要 members 意圖的旗標（例如 joined）由 discord.py 檢查"""
+    flags = discord.MemberCacheFlags.none()
+    for name in MEMBER_CACHE:
+        if name not in discord.MemberCacheFlags.VALID_FLAGS:
+            raise ValueError(f'未知的成員快取設定: {name}')
+        setattr(flags, name, True)
+    return flags
+
 # 設置機器人前綴和意圖
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-intents.presences = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+intents = build_intents()
+bot_options = dict(
+    command_prefix='!',
+    intents=intents,
+    member_cache_flags=build_member_cache_flags(),
+    # 不在啟動時下載每個伺服器的完整成員名單
+    chunk_guilds_at_startup=False,
+)
+if BOT_SHARDING == 'auto':
+    bot = commands.AutoShardedBot(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **bot_options)
+else:
+    bot = commands.Bot(**bot_options)
+
+# 啟動時要加載的模組：(擴展路徑, 顯示名稱)
+EXTENSIONS = [
+    ('cogs.music', '音樂模組'),
+    ('cogs.llm_chat', 'LLM 聊天模組'),
+]
+
+async def load_extension_timed(path, name):
+    """加載單一模組並印出耗時"""
+    start = time.perf_counter()
+    try:
+        await bot.load_extension(path)
+        print(f'{name}已加載！（{time.perf_counter() - start:.2f}s）')
+    except Exception as e:
+        print(f'加載{name}時發生錯誤: {str(e)}')
+
+# 登入後、連上 Gateway 前只執行一次；重新連線觸發的 on_ready 不會重複加載模組
+# 模組依序加載（import 與 setup 都是同步執行，並行不會更快），大型依賴已改為延後匯入
+async def setup_hook():
+    start = time.perf_counter()
+    for path, name in EXTENSIONS:
+        await load_extension_timed(path, name)
+    print(f'模組加載完成，耗時 {time.perf_counter() - start:.2f}s（啟動至今 {time.perf_counter() - STARTED_AT:.2f}s）')
+
+bot.setup_hook = setup_hook
 
 # 當機器人準備就緒時
 @bot.event
 async def on_ready():
-    print(f'{bot.user} 已上線！')
-    # 加載音樂 Cog
-    try:
-        await bot.load_extension('cogs.music')
-        print('音樂模組已加載！')
-    except Exception as e:
-        print(f'加載音樂模組時發生錯誤: {str(e)}')
-    # 加載 LLM 聊天 Cog
-    try:
-        await bot.load_extension('cogs.llm_chat')
-        print('LLM 聊天模組已加載！')
-    except Exception as e:
-        print(f'加載 LLM 聊天模組時發生錯誤: {str(e)}')
+    print(f'{bot.user} 已上線！共 {len(bot.guilds)} 個伺服器、{bot.shard_count or 1} 個分片（啟動至今 {time.perf_counter() - STARTED_AT:.2f}s）')
+
+@bot.event
+async def on_shard_ready(shard_id):
+    print(f'分片 {shard_id} 已就緒')
 
 # 重新加載命令
 @bot.command()
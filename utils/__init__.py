@@ -0,0 +1 @@
+# 這個文件用來標記 utils 為 Python 包，放置各 Cog 共用的工具類別
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU + TTL 快取
+
+    超過 maxsize 時淘汰最久未使用的項目，每個項目在 ttl 秒後過期（可逐項覆寫）。
+    指定 path 時可用 load/save 持久化到本地 JSON 檔案，值必須能被 JSON 序列化。
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.dirty = False
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        item = self._data.get(key)
+        if item is None:
+            if count:
+                self.misses += 1
+            return default
+        expires_at, value = item
+        if expires_at <= time.time():
+            del self._data[key]
+            self.expirations += 1
+            self.dirty = True
+            if count:
+                self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        self.dirty = True
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        if item is None:
+            return default
+        self.dirty = True
+        expires_at, value = item
+        return value if expires_at > time.time() else default
+
+    def clear(self):
+        self._data.clear()
+        self.dirty = True
+
+    def purge(self):
+        """移除所有已過期的項目，回傳移除數量"""
+        now = time.time()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        if expired:
+            self.expirations += len(expired)
+            self.dirty = True
+        return len(expired)
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"讀取快取檔案時發生錯誤: {str(e)}")
+            return
+        now = time.time()
+        for key, expires_at, value in items:
+            if expires_at > now:
+                self._data[key] = (expires_at, value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        self.dirty = False
+
+    def snapshot(self):
+        """清除過期項目並取得可序列化的內容快照，需在存取快取的同一執行緒（事件迴圈）中呼叫
+
+        取得快照後即視為已保存；write 失敗時會重新標記為 dirty。
+        """
+        self.purge()
+        self.dirty = False
+        return [[key, expires_at, value] for key, (expires_at, value) in self._data.items()]
+
+    def write(self, items):
+        """將 snapshot 的結果寫入 JSON 檔案（先寫暫存檔再取代，避免寫到一半損毀）
+
+        不會存取快取內容，可以在其他執行緒中執行。
+        """
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(items, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            self.dirty = True
+            print(f"寫入快取檔案時發生錯誤: {str(e)}")
+
+    def save(self):
+        """立即寫入 JSON 檔案"""
+        if not self.path:
+            return
+        self.write(self.snapshot())
+
+
+_MISSING = object()
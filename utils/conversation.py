@@ -0,0 +1,111 @@
+from utils.cache import TTLCache
+from utils.text import estimate_tokens, truncate_tokens
+
+# 圖片在歷史紀錄中只保留文字說明，不保留網址或圖片內容
+IMAGE_PLACEHOLDER = "[使用者附上了一張圖片]"
+
+
+def message_text(content):
+    """將訊息內容（字串或多模態區塊）轉為純文字，圖片以說明文字取代"""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content:
+        if block.get("type") == "text":
+            parts.append(block.get("text", ""))
+        else:
+            parts.append(IMAGE_PLACEHOLDER)
+    return "\n".join(part for part in parts if part)
+
+
+class Conversation:
+    """單一對話的歷史紀錄"""
+
+    def __init__(self):
+        self.messages = []  # [{"role": ..., "content": ...}]
+        self.tokens = 0
+        self.summary = ""  # 較舊對話的滾動摘要
+        self.pending = []  # 已移出歷史、等待併入摘要的訊息
+        self.compacting = False
+
+    def append(self, role, content):
+        text = message_text(content)
+        self.messages.append({"role": role, "content": text})
+        self.tokens += estimate_tokens(text)
+
+    def trim(self, max_tokens, keep=2):
+        """從最舊的訊息開始移除，直到 token 數不超過 max_tokens
+
+        被移除的訊息放入 pending 等待併入摘要，並一併回傳。
+        """
+        dropped = []
+        while self.tokens > max_tokens and len(self.messages) > keep:
+            message = self.messages.pop(0)
+            self.tokens -= estimate_tokens(message["content"])
+            dropped.append(message)
+        self.pending.extend(dropped)
+        return dropped
+
+    def take_pending(self, max_tokens):
+        """依時間順序取出總共不超過 max_tokens 的待摘要訊息，其餘留在 pending 等待下一輪
+
+        單則超過上限的訊息會截斷後取出，每輪至少取出一則，不會捨棄任何訊息。
+        """
+        taken = []
+        used = 0
+        while self.pending:
+            message = self.pending[0]
+            tokens = estimate_tokens(message["content"])
+            if taken and used + tokens > max_tokens:
+                break
+            self.pending.pop(0)
+            if tokens > max_tokens:
+                message = {"role": message["role"], "content": truncate_tokens(message["content"], max_tokens)}
+                tokens = max_tokens
+            taken.append(message)
+            used += tokens
+        return taken
+
+    def prompt_history(self):
+        """交給 LLM 的歷史紀錄，有摘要時放在最前面"""
+        if not self.summary:
+            return list(self.messages)
+        return [{"role": "system", "content": f"先前對話摘要：{self.summary}"}] + self.messages
+
+
+class ConversationStore:
+    """依伺服器與頻道（可選擇再依使用者）區分的對話紀錄
+
+    每段對話依估計的 token 數截斷，閒置超過 idle_ttl 秒或超過 max_conversations 段時淘汰。
+    """
+
+    def __init__(self, max_tokens=4000, idle_ttl=3600, max_conversations=1000, per_user=False):
+        self.max_tokens = max_tokens
+        self.idle_ttl = idle_ttl
+        self.per_user = per_user
+        self._conversations = TTLCache(maxsize=max_conversations, ttl=idle_ttl)
+
+    def key(self, message):
+        guild_id = message.guild.id if message.guild else 0
+        user_id = message.author.id if self.per_user else 0
+        return f"{guild_id}:{message.channel.id}:{user_id}"
+
+    def get(self, key):
+        """取得對話並延長閒置期限，不存在時建立"""
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            conversation = Conversation()
+        self._conversations.set(key, conversation)
+        return conversation
+
+    def history(self, key):
+        return self.get(key).prompt_history()
+
+    def append(self, key, role, content):
+        """加入訊息並截斷，回傳因超過 token 上限而被移除的訊息"""
+        conversation = self.get(key)
+        conversation.append(role, content)
+        return conversation.trim(self.max_tokens)
+
+    def __len__(self):
+        return len(self._conversations)
@@ -0,0 +1,34 @@
+import os
+import aiohttp
+
+# 共用 HTTP 連線池設定
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '100'))
+HTTP_POOL_PER_HOST = int(os.getenv('HTTP_POOL_PER_HOST', '8'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))
+HTTP_KEEPALIVE = float(os.getenv('HTTP_KEEPALIVE', '30'))
+
+DEFAULT_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+        '(KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+    ),
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+
+def create_session(**kwargs):
+    """建立共用的 aiohttp 連線池，必須在事件迴圈中呼叫，使用完畢需 await session.close()
+
+    同一主機的連線會保持 keep-alive 並重複使用，DNS 查詢結果會快取 HTTP_DNS_CACHE_TTL 秒，
+    每個請求（含連線、傳送與讀取）的總時間上限為 HTTP_TIMEOUT 秒。
+    """
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_SIZE,
+        limit_per_host=HTTP_POOL_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE,
+    )
+    kwargs.setdefault('timeout', aiohttp.ClientTimeout(total=HTTP_TIMEOUT))
+    kwargs.setdefault('headers', DEFAULT_HEADERS)
+    return aiohttp.ClientSession(connector=connector, **kwargs)
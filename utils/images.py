@@ -0,0 +1,84 @@
+import io
+import base64
+import asyncio
+import hashlib
+
+from utils.cache import TTLCache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 未安裝 Pillow 時直接使用原始圖片網址
+    Image = None
+
+
+class ImagePipeline:
+    """視覺模型的圖片前處理
+
+    透過共用連線池下載附件一次，縮小到最長邊 max_edge 像素並重新編碼為 JPEG，
+    結果依圖片內容的 SHA-256 快取（同一附件另以 ID 快取，免去重複下載）。
+    未安裝 Pillow、附件過大或處理失敗時回傳原始網址。
+    """
+
+    def __init__(self, max_edge=1024, quality=85, max_download=20 * 1024 * 1024, cache_size=64):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.max_download = max_download
+        self._by_hash = TTLCache(maxsize=cache_size, ttl=3600)
+        self._by_attachment = TTLCache(maxsize=cache_size * 4, ttl=3600)
+
+    def _encode(self, data):
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=self.quality, optimize=True)
+        return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode('ascii')
+
+    async def _read_body(self, response):
+        """讀取完整的回應內容，超過 max_download 時回傳 None
+
+        StreamReader.read(n) 只回傳目前已緩衝的資料，必須逐塊讀到結束才是完整的圖片。
+        """
+        if response.content_length and response.content_length > self.max_download:
+            return None
+        buffer = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            buffer += chunk
+            if len(buffer) > self.max_download:
+                return None
+        return bytes(buffer)
+
+    async def prepare(self, session, attachment):
+        """回傳可交給 LLM 的圖片網址（處理後為 data URL）"""
+        if Image is None or (attachment.size and attachment.size > self.max_download):
+            return attachment.url
+        attachment_key = f"{attachment.id}:{attachment.size}"
+        digest = self._by_attachment.get(attachment_key)
+        if digest:
+            cached = self._by_hash.get(digest)
+            if cached:
+                return cached
+        try:
+            async with session.get(attachment.url) as response:
+                response.raise_for_status()
+                data = await self._read_body(response)
+            if data is None:
+                return attachment.url
+            digest = hashlib.sha256(data).hexdigest()
+            self._by_attachment.set(attachment_key, digest)
+            cached = self._by_hash.get(digest)
+            if cached:
+                return cached
+            data_url = await asyncio.to_thread(self._encode, data)
+            self._by_hash.set(digest, data_url)
+            return data_url
+        except Exception as e:
+            print(f"處理圖片時發生錯誤: {str(e)}")
+            return attachment.url
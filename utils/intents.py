@@ -0,0 +1,52 @@
+import re
+
+# 句首、句尾可忽略的客套詞與標點
+LEADING_FILLER = re.compile(r'^(?:(?:請你?|麻煩你?|幫我|幫忙|可以|能不能|please|pls|hey)\s*)+', re.IGNORECASE)
+TRAILING_FILLER = re.compile(r'(?:\s*(?:一下|吧|啦|喔|哦|好嗎|謝謝|thanks|thank you|please|pls|[!！?？。.,，~～]))+$', re.IGNORECASE)
+
+# (指令, 規則)；只收錄意思明確的說法，其餘交給 agent 判斷
+# 單獨的 next、continue、stop、繼續、停止在一般對話中也很常見，交給 agent 判斷
+INTENT_PATTERNS = [
+    ('skip', re.compile(r'^(?:skip(?: this(?: song)?)?|next song|跳過(?:這首歌?|歌曲)?|下一首歌?|切歌|換一?首歌?)$', re.IGNORECASE)),
+    ('pause', re.compile(r'^(?:pause(?: (?:the )?music)?|暫停(?:播放|音樂)?)$', re.IGNORECASE)),
+    ('resume', re.compile(r'^(?:resume|continue (?:playing|the music)|unpause|繼續(?:播放|放歌|音樂)|恢復播放)$', re.IGNORECASE)),
+    ('leave', re.compile(r'^(?:leave|stop (?:the )?music|disconnect|停止(?:播放|音樂)|離開(?:語音(?:頻道)?)?|退出語音(?:頻道)?|停歌)$', re.IGNORECASE)),
+    ('join', re.compile(r'^(?:join(?: (?:the )?voice(?: channel)?)?|加入(?:語音(?:頻道)?)?|進語音(?:頻道)?)$', re.IGNORECASE)),
+    ('queue', re.compile(r'^(?:queue|show (?:the )?queue|(?:播放)?隊列|播放清單|查看隊列)$', re.IGNORECASE)),
+    ('time', re.compile(r'^(?:what time is it(?: now)?|現在(?:是)?幾點(?:了)?|幾點了?|現在時間|現在幾點鐘)$', re.IGNORECASE)),
+]
+# 只接受明確的點歌動詞；「我想聽」「來一首」也常用在聊天（「我想聽聽你的意見」「來一首詩」）
+PLAY_PATTERN = re.compile(r'^(?:play\s+|播放|點播)\s*(?:一首)?(?P<arg>.+)$', re.IGNORECASE)
+# 「播放音樂」這類沒有指定歌曲的說法不走捷徑
+# 含疑問語氣的句子通常不是指令，交給 agent
+QUESTION_PATTERN = re.compile(r'[嗎呢?？]|什麼|怎麼|為什麼|如何|是否|\b(?:what|why|how|who|is|are|can|does)\b', re.IGNORECASE)
+PLAY_BLOCKLIST = re.compile(r'^(?:器|清單|列表|程式|狀態|速度|紀錄|記錄|me\b|us\b)', re.IGNORECASE)
+# 對 bot 說話或要求 bot 做事的內容不是歌名，例如「播放你的建議」「play a game with me」
+PLAY_CHAT_PATTERN = re.compile(r'你|妳|意見|建議|故事|笑話|\bgames?\b|\bwith (?:me|us)\b', re.IGNORECASE)
+GENERIC_PLAY_ARGS = {'音樂', '歌', '歌曲', '一首歌', '首歌', 'music', 'a song', 'something', '點歌', '點音樂'}
+
+
+def normalize(text):
+    text = ' '.join(text.split())
+    text = LEADING_FILLER.sub('', text)
+    text = TRAILING_FILLER.sub('', text)
+    return text.strip()
+
+
+def match_intent(text):
+    """辨識明確的音樂或時間指令，回傳 (指令, 參數)；無法確定時回傳 None"""
+    text = normalize(text)
+    if not text:
+        return None
+    for command, pattern in INTENT_PATTERNS:
+        if pattern.match(text):
+            return command, ''
+    match = PLAY_PATTERN.match(text)
+    if match and not QUESTION_PATTERN.search(text):
+        arg = match.group('arg').strip(' 「」『』"\'')
+        if (
+            arg and arg.lower() not in GENERIC_PLAY_ARGS
+            and not PLAY_BLOCKLIST.match(arg) and not PLAY_CHAT_PATTERN.search(arg)
+        ):
+            return 'play', arg
+    return None
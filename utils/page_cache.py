@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from utils.cache import TTLCache
+
+# 追蹤用參數不影響網頁內容，正規化網址時移除
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'igshid', 'mc_cid', 'mc_eid')
+
+
+def canonical_url(url):
+    """正規化網址：小寫 scheme/host、移除預設埠號、片段與追蹤參數，並排序查詢參數"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+def url_key(url):
+    return hashlib.sha256(canonical_url(url).encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """網頁正文快取，以正規化網址的 SHA-256 為鍵
+
+    記憶體層為 LRU，可選的磁碟層把每個網頁存成一個 JSON 檔案。
+    項目在 ttl 秒內視為新鮮可直接使用；超過 ttl 但未超過 max_age 的項目仍保留
+    ETag/Last-Modified，供呼叫端發送條件請求，收到 304 後以 revalidated 延長新鮮期。
+    """
+
+    def __init__(self, maxsize=256, ttl=600, max_age=86400, directory=None, disk_max=2000):
+        self.ttl = ttl
+        self.max_age = max_age
+        self.directory = directory
+        self.disk_max = disk_max
+        self.memory = TTLCache(maxsize=maxsize, ttl=max_age)
+        self._writes = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def is_fresh(self, entry):
+        return time.time() - entry['validated_at'] < self.ttl
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('validated_at', 0) >= self.max_age:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write_disk(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"寫入網頁快取時發生錯誤: {str(e)}")
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """磁碟層超過 disk_max 個檔案時，刪除最久未驗證的檔案"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        files.append((os.path.getmtime(path), path))
+                    except OSError:
+                        pass
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.disk_max)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remaining(self, entry):
+        return self.max_age - (time.time() - entry['validated_at'])
+
+    async def get(self, url):
+        """取得快取項目（可能已不新鮮），沒有時回傳 None"""
+        key = url_key(url)
+        entry = self.memory.get(key)
+        if entry is None and self.directory:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry:
+                self.memory.set(key, entry, ttl=self._remaining(entry))
+        return entry
+
+    async def set(self, url, text, etag=None, last_modified=None):
+        entry = {
+            'url': canonical_url(url),
+            'text': text,
+            'etag': etag,
+            'last_modified': last_modified,
+            'validated_at': time.time(),
+        }
+        await self._store(url_key(url), entry)
+        return entry
+
+    async def revalidated(self, entry):
+        """伺服器回覆 304 時呼叫，延長項目的新鮮期"""
+        entry['validated_at'] = time.time()
+        await self._store(url_key(entry['url']), entry)
+
+    async def _store(self, key, entry):
+        self.memory.set(key, entry, ttl=self.max_age)
+        if self.directory:
+            await asyncio.to_thread(self._write_disk, key, entry)
@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+    guild_id INTEGER NOT NULL,
+    video_id TEXT NOT NULL,
+    played_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plays_guild_time ON plays (guild_id, played_at);
+CREATE TABLE IF NOT EXISTS tracks (
+    video_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    duration INTEGER
+);
+CREATE TABLE IF NOT EXISTS pairs (
+    guild_id INTEGER NOT NULL,
+    video_id TEXT NOT NULL,
+    other_id TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, video_id, other_id)
+) WITHOUT ROWID;
+"""
+
+
+class PlayHistory:
+    """以 SQLite 保存每個伺服器的播放紀錄與歌曲共現索引
+
+    同一伺服器中前後播放的兩首歌視為一次共現（雙向計數），推薦時依共現次數排序，
+    沒有共現資料時改用該伺服器最常播放的歌曲。所有方法都是同步且會存取磁碟，
+    請在執行緒中呼叫；內部以鎖保護同一個連線。每個伺服器最多保留 max_plays 筆播放紀錄。
+    """
+
+    def __init__(self, path=':memory:', max_plays=5000):
+        self.path = path
+        self.max_plays = max_plays
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._writes = Counter()  # guild_id -> 寫入次數
+
+    def record(self, guild_id, video_id, title, duration=None, previous_id=None):
+        """記錄一次播放，previous_id 為同一伺服器上一首播放的歌曲"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO tracks (video_id, title, duration) VALUES (?, ?, ?) "
+                "ON CONFLICT(video_id) DO UPDATE SET title = excluded.title, "
+                "duration = COALESCE(excluded.duration, tracks.duration)",
+                (video_id, title, duration),
+            )
+            self._conn.execute(
+                "INSERT INTO plays (guild_id, video_id, played_at) VALUES (?, ?, ?)",
+                (guild_id, video_id, time.time()),
+            )
+            if previous_id and previous_id != video_id:
+                self._conn.executemany(
+                    "INSERT INTO pairs (guild_id, video_id, other_id, count) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT(guild_id, video_id, other_id) DO UPDATE SET count = count + 1",
+                    [(guild_id, previous_id, video_id), (guild_id, video_id, previous_id)],
+                )
+            self._writes[guild_id] += 1
+            # 每個伺服器每 100 次寫入清理一次該伺服器超出上限的舊紀錄
+            if self._writes[guild_id] % 100 == 0:
+                self._prune(guild_id)
+
+    def _prune(self, guild_id):
+        """只保留該伺服器最新的 max_plays 筆播放紀錄，並移除已不在紀錄中的歌曲的共現與資訊"""
+        self._conn.execute(
+            "DELETE FROM plays WHERE guild_id = ? AND played_at < ("
+            "SELECT played_at FROM plays WHERE guild_id = ? ORDER BY played_at DESC LIMIT 1 OFFSET ?)",
+            (guild_id, guild_id, self.max_plays - 1),
+        )
+        self._conn.execute(
+            "DELETE FROM pairs WHERE guild_id = ? AND ("
+            "video_id NOT IN (SELECT video_id FROM plays WHERE guild_id = ?) OR "
+            "other_id NOT IN (SELECT video_id FROM plays WHERE guild_id = ?))",
+            (guild_id, guild_id, guild_id),
+        )
+        self._conn.execute("DELETE FROM tracks WHERE video_id NOT IN (SELECT video_id FROM plays)")
+
+    def recent_ids(self, guild_id, limit=50):
+        """該伺服器最近播放過的歌曲 ID"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id FROM plays WHERE guild_id = ? ORDER BY played_at DESC LIMIT ?",
+                (guild_id, limit),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def candidates(self, guild_id, seed_id, exclude=(), limit=5):
+        """依與 seed_id 的共現次數推薦歌曲，不足時以該伺服器最常播放的歌曲補足
+
+        回傳 [{'id', 'title', 'duration'}]，不包含 exclude 中的歌曲。
+        """
+        exclude = set(exclude) | {seed_id}
+        results = []
+        with self._lock:
+            queries = (
+                ("SELECT p.other_id, t.title, t.duration FROM pairs p JOIN tracks t ON t.video_id = p.other_id "
+                 "WHERE p.guild_id = ? AND p.video_id = ? ORDER BY p.count DESC LIMIT ?",
+                 (guild_id, seed_id, limit + len(exclude))),
+                ("SELECT p.video_id, t.title, t.duration FROM plays p JOIN tracks t ON t.video_id = p.video_id "
+                 "WHERE p.guild_id = ? GROUP BY p.video_id ORDER BY COUNT(*) DESC LIMIT ?",
+                 (guild_id, limit + len(exclude))),
+            )
+            for sql, params in queries:
+                for video_id, title, duration in self._conn.execute(sql, params):
+                    if video_id in exclude:
+                        continue
+                    exclude.add(video_id)
+                    results.append({'id': video_id, 'title': title, 'duration': duration})
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
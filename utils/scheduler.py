@@ -0,0 +1,117 @@
+import asyncio
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+
+
+class SchedulerBusyError(Exception):
+    """等待佇列已滿，呼叫端應請使用者稍後再試"""
+
+
+class RequestScheduler:
+    """限制同時執行的請求數量，並在頻道之間輪流分配名額
+
+    同時執行的請求總數不超過 max_concurrency，同一使用者不超過 per_user、同一頻道不超過
+    per_channel。暫時無法執行的請求依頻道排隊，名額釋放時依頻道輪流（round-robin）放行；
+    排隊總數超過 max_queue 或同一使用者排隊超過 user_queue 時拋出 SchedulerBusyError。
+    """
+
+    def __init__(self, max_concurrency=4, per_user=1, per_channel=2, max_queue=20, user_queue=2):
+        self.max_concurrency = max_concurrency
+        self.per_user = per_user
+        self.per_channel = per_channel
+        self.max_queue = max_queue
+        self.user_queue = user_queue
+        self._running = 0
+        self._channel_running = Counter()
+        self._user_running = Counter()
+        self._user_waiting = Counter()
+        self._waiting = OrderedDict()  # channel_id -> deque[(user_id, future)]
+        self._queued = 0
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def queued(self):
+        return self._queued
+
+    @asynccontextmanager
+    async def slot(self, channel_id, user_id):
+        await self._acquire(channel_id, user_id)
+        try:
+            yield
+        finally:
+            self._release(channel_id, user_id)
+
+    def _can_run(self, channel_id, user_id):
+        return (
+            self._running < self.max_concurrency
+            and self._channel_running[channel_id] < self.per_channel
+            and self._user_running[user_id] < self.per_user
+        )
+
+    async def _acquire(self, channel_id, user_id):
+        if self._queued >= self.max_queue or self._user_waiting[user_id] >= self.user_queue:
+            raise SchedulerBusyError("目前請求太多，請稍後再試！")
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(channel_id, deque()).append((user_id, future))
+        self._queued += 1
+        self._user_waiting[user_id] += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已取得名額但呼叫端被取消，歸還名額
+                self._release(channel_id, user_id)
+            else:
+                self._remove_waiting(channel_id, user_id, future)
+            raise
+
+    def _remove_waiting(self, channel_id, user_id, future):
+        queue = self._waiting.get(channel_id)
+        if not queue:
+            return
+        try:
+            queue.remove((user_id, future))
+        except ValueError:
+            return
+        self._queued -= 1
+        self._user_waiting[user_id] -= 1
+        if not self._user_waiting[user_id]:
+            del self._user_waiting[user_id]
+        if not queue:
+            del self._waiting[channel_id]
+
+    def _release(self, channel_id, user_id):
+        self._running -= 1
+        self._channel_running[channel_id] -= 1
+        if not self._channel_running[channel_id]:
+            del self._channel_running[channel_id]
+        self._user_running[user_id] -= 1
+        if not self._user_running[user_id]:
+            del self._user_running[user_id]
+        self._dispatch()
+
+    def _dispatch(self):
+        """依頻道輪流放行可執行的請求，直到名額用完或沒有可放行的請求"""
+        progressed = True
+        while progressed and self._running < self.max_concurrency:
+            progressed = False
+            for channel_id in list(self._waiting):
+                queue = self._waiting[channel_id]
+                entry = next((item for item in queue if self._can_run(channel_id, item[0])), None)
+                if entry is None:
+                    continue
+                user_id, future = entry
+                self._remove_waiting(channel_id, user_id, future)
+                self._running += 1
+                self._channel_running[channel_id] += 1
+                self._user_running[user_id] += 1
+                future.set_result(None)
+                # 被服務過的頻道排到最後，讓其他頻道優先
+                if channel_id in self._waiting:
+                    self._waiting.move_to_end(channel_id)
+                progressed = True
+                break
@@ -0,0 +1,46 @@
+import asyncio
+
+from utils.cache import TTLCache
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """合併相同鍵的並行請求
+
+    同一個鍵同時只會執行一次，其他呼叫者等待同一個結果；成功的結果再快取 ttl 秒。
+    實際工作在獨立的 Task 中執行，個別呼叫者被取消不會影響其他等待者。
+    """
+
+    def __init__(self, ttl=30, maxsize=256):
+        self._inflight = {}  # key -> asyncio.Task
+        self.results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared = 0  # 合併到進行中請求的次數
+
+    async def do(self, key, fn, cacheable=None):
+        """執行 fn() 或沿用相同鍵的進行中請求／快取結果；cacheable(result) 為 False 時不快取"""
+        result = self.results.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t, cacheable))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key, task, cacheable):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if cacheable is None or cacheable(result):
+            self.results.set(key, result)
+
+    def stats(self):
+        stats = self.results.stats()
+        stats['inflight'] = len(self._inflight)
+        stats['shared'] = self.shared
+        return stats
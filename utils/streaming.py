@@ -0,0 +1,158 @@
+import re
+import asyncio
+from langchain_core.callbacks import BaseCallbackHandler
+
+DISCORD_MESSAGE_LIMIT = 2000
+CURSOR = " ▌"
+
+
+def split_message(text, limit):
+    """切成不超過 limit 字元的段落，優先在換行處切開；已填滿的段落不會因後續文字而改變"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n', limit // 2, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    chunks.append(text)
+    return chunks
+
+
+class DiscordStreamWriter:
+    """將逐步產生的文字寫入 Discord 訊息
+
+    以 interval 秒為間隔編輯訊息以避開速率限制，超過單則訊息長度上限的部分
+    會接續發送新訊息。push 必須在事件迴圈中呼叫（其他執行緒請用 call_soon_threadsafe）。
+    """
+
+    def __init__(self, channel, interval=1.2, limit=DISCORD_MESSAGE_LIMIT - len(CURSOR)):
+        self.channel = channel
+        self.interval = interval
+        self.limit = limit
+        self.text = ""
+        self.messages = []
+        self._rendered = []
+        self._changed = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._closed = False
+        self._task = None
+
+    @property
+    def started(self):
+        return bool(self.messages)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def push(self, token):
+        self.text += token
+        self._changed.set()
+
+    def reset(self):
+        """捨棄目前累積的文字，已送出的訊息會在下次更新時刪除"""
+        self.text = ""
+        self._changed.set()
+
+    async def _run(self):
+        while not self._closed:
+            await self._changed.wait()
+            self._changed.clear()
+            if self._closed:
+                break
+            try:
+                await self._flush(cursor=True)
+            except Exception as e:
+                print(f"串流更新訊息時發生錯誤: {str(e)}")
+            # 等待下一次編輯的間隔；finish 時立即結束，不必等完整個間隔
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _flush(self, cursor):
+        if not self.text.strip() and not self.messages:
+            return
+        chunks = split_message(self.text, self.limit) if self.text.strip() else []
+        for index, chunk in enumerate(chunks):
+            display = chunk + (CURSOR if cursor and index == len(chunks) - 1 else "")
+            if index < len(self.messages):
+                if self._rendered[index] != display:
+                    await self.messages[index].edit(content=display)
+                    self._rendered[index] = display
+            elif chunk.strip():
+                self.messages.append(await self.channel.send(display))
+                self._rendered.append(display)
+        if not cursor or not chunks:
+            # 最終內容比串流時短或文字已被捨棄，刪除多出來的訊息
+            extra, self.messages = self.messages[len(chunks):], self.messages[:len(chunks)]
+            del self._rendered[len(chunks):]
+            for message in extra:
+                await message.delete()
+
+    async def finish(self, final_text=None):
+        """停止串流並寫入最終內容（預設為目前累積的文字）"""
+        self._closed = True
+        self._changed.set()
+        self._stopped.set()
+        if self._task:
+            try:
+                await self._task
+            except Exception:
+                pass
+        if final_text is not None:
+            self.text = final_text
+        await self._flush(cursor=False)
+
+
+class FinalAnswerStreamHandler(BaseCallbackHandler):
+    """將 LLM 產生的最終回答 token 轉送給 DiscordStreamWriter
+
+    agent 的輸出中只有 prefix（例如 ReAct 的 "AI:"）之後的文字才是給使用者的回答；
+    prefix 為 None 時轉送全部 token。以工具呼叫結束的步驟不是最終回答，已轉送的文字會被撤回。
+    可在任何執行緒中被呼叫。
+    """
+
+    # 只轉送 token，不會阻塞，非同步執行時直接在事件迴圈中呼叫
+    run_inline = True
+
+    def __init__(self, writer, loop, prefix=None):
+        self.writer = writer
+        self.loop = loop
+        self.prefix_pattern = re.compile(r'(?:^|\n)\s*%s\s*' % re.escape(prefix)) if prefix else None
+        self._buffer = ""
+        self._streaming = prefix is None
+        self._emitted = False
+
+    def _emit(self, text):
+        if text:
+            self._emitted = True
+            self.loop.call_soon_threadsafe(self.writer.push, text)
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        # 每次 LLM 呼叫重新尋找 prefix；已開始輸出回答後不再重置
+        if self.prefix_pattern is not None and not self._emitted:
+            self._buffer = ""
+            self._streaming = False
+
+    def on_llm_end(self, response, **kwargs):
+        # 原生 function calling 可能在工具呼叫前先輸出一段說明，這一步的文字不應留在訊息中
+        tool_calls = any(
+            getattr(getattr(generation, 'message', None), 'tool_calls', None)
+            for generations in response.generations for generation in generations
+        )
+        if tool_calls and self._emitted:
+            self._buffer = ""
+            self._streaming = self.prefix_pattern is None
+            self._emitted = False
+            self.loop.call_soon_threadsafe(self.writer.reset)
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self._streaming:
+            self._emit(token)
+            return
+        self._buffer += token
+        match = self.prefix_pattern.search(self._buffer)
+        if match:
+            self._streaming = True
+            self._emit(self._buffer[match.end():])
@@ -0,0 +1,109 @@
+import re
+import unicodedata
+
+CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]')
+WORD_PATTERN = re.compile(r'[a-z0-9]{2,}')
+
+
+def normalize_text(text):
+    """正規化文字作為比對或快取鍵：全半形統一、轉小寫、合併空白"""
+    return ' '.join(unicodedata.normalize('NFKC', text).lower().split())
+
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓文字約一字一個 token，其餘約四個字元一個 token"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def terms(text):
+    """擷取用於比對相關性的詞：英數單字與中日韓文字的二元組"""
+    text = text.lower()
+    result = set(WORD_PATTERN.findall(text))
+    for run in re.findall(r'(?:%s)+' % CJK_PATTERN.pattern, text):
+        if len(run) == 1:
+            result.add(run)
+        result.update(run[i:i + 2] for i in range(len(run) - 1))
+    return result
+
+
+def _prefix_length(text, budget):
+    """不超過 budget 個 token 的最長開頭字元數"""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def truncate_tokens(text, budget):
+    """從開頭保留不超過 budget 個 token 的文字"""
+    if estimate_tokens(text) <= budget:
+        return text
+    return text[:_prefix_length(text, budget)] + "…"
+
+
+def _split_line(line, budget):
+    """將超過 budget 個 token 的單行切成多段，每段不超過 budget"""
+    pieces = []
+    while estimate_tokens(line) > budget:
+        cut = max(_prefix_length(line, budget), 1)
+        # 盡量在空白處切開，避免切斷英文單字
+        space = line.rfind(' ', cut // 2, cut)
+        if space > 0:
+            cut = space
+        pieces.append(line[:cut])
+        line = line[cut:].lstrip(' ')
+    pieces.append(line)
+    return pieces
+
+
+def fit_to_budget(text, question="", budget=3000):
+    """依與問題的相關性挑選段落，使總長度不超過 budget 個 token
+
+    沒有問題或所有段落都不相關時保留開頭的段落；挑出的段落維持原本的順序。
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    paragraphs = [line for line in text.split('\n') if line.strip()]
+    query_terms = terms(question) if question else set()
+
+    def score(index):
+        overlap = len(query_terms & terms(paragraphs[index])) if query_terms else 0
+        # 相關性相同時偏好前面的段落
+        return (overlap, -index)
+
+    order = sorted(range(len(paragraphs)), key=score, reverse=True)
+    selected = []
+    used = 0
+    for index in order:
+        cost = estimate_tokens(paragraphs[index]) + 1
+        if used + cost > budget:
+            continue
+        selected.append(index)
+        used += cost
+    if not selected:
+        return truncate_tokens(paragraphs[order[0]], budget)
+    return '\n'.join(paragraphs[index] for index in sorted(selected))
+
+
+def split_chunks(text, chunk_tokens):
+    """按段落切成每塊約 chunk_tokens 個 token 的區塊"""
+    chunks = []
+    current = []
+    used = 0
+    for paragraph in text.split('\n'):
+        # 沒有換行的長文字先切成多段，不會因截斷而遺失內容
+        for line in _split_line(paragraph, chunk_tokens - 1):
+            cost = estimate_tokens(line) + 1
+            if current and used + cost > chunk_tokens:
+                chunks.append('\n'.join(current))
+                current, used = [], 0
+            current.append(line)
+            used += cost
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
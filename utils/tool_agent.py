@@ -0,0 +1,76 @@
+import asyncio
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+# 步數用完時要求模型直接回答的提示
+FINAL_ANSWER_PROMPT = "工具呼叫次數已達上限，請根據目前取得的資訊直接回答使用者，不要再呼叫工具。"
+
+
+def content_text(content):
+    """取出模型回覆中的文字部分（內容可能是字串或多個區塊）"""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+
+class ToolCallingAgent:
+    """以模型原生的 function calling 執行工具的 agent
+
+    每一步呼叫一次 LLM；模型同一步要求的多個工具呼叫會並行執行，結果一起交回模型。
+    最多執行 max_steps 步，用完時不再提供工具，要求模型直接回答。
+    介面與 langchain AgentExecutor 相同：ainvoke({"input", "chat_history"}) 回傳 {"output": ...}。
+    """
+
+    def __init__(self, llm, tools, system_prompt, max_steps=3):
+        self.tools = {tool.name: tool for tool in tools}
+        self.system_prompt = system_prompt
+        self.max_steps = max(1, max_steps)
+        self.llm = llm.bind_tools(tools)
+        self.answer_llm = llm.bind_tools(tools, tool_choice="none")
+
+    def build_messages(self, inputs):
+        """組合 system prompt、歷史紀錄與本次輸入；歷史中的摘要併入 system prompt"""
+        system_prompt = self.system_prompt
+        history = []
+        for message in inputs.get("chat_history", []):
+            role, content = message["role"], message["content"]
+            if role == "system":
+                system_prompt += f"\n\n{content}"
+            elif role == "assistant":
+                history.append(AIMessage(content=content))
+            else:
+                history.append(HumanMessage(content=content))
+        return [SystemMessage(content=system_prompt)] + history + [HumanMessage(content=inputs["input"])]
+
+    async def call_tool(self, tool_call, config):
+        """執行單一工具呼叫，錯誤以文字回傳給模型而不中斷整個回合"""
+        tool = self.tools.get(tool_call["name"])
+        if tool is None:
+            content = f"沒有名為 {tool_call['name']} 的工具"
+        else:
+            try:
+                args = tool_call["args"]
+                # 單一字串參數的工具：傳入唯一的參數值，無參數時傳入空字串
+                tool_input = next(iter(args.values()), "") if len(args) <= 1 else args
+                content = str(await tool.ainvoke(tool_input, config=config))
+            except Exception as e:
+                content = f"工具執行失敗：{str(e)}"
+        return ToolMessage(content=content, tool_call_id=tool_call["id"], name=tool_call["name"])
+
+    async def ainvoke(self, inputs, config=None):
+        messages = self.build_messages(inputs)
+        for _ in range(self.max_steps):
+            response = await self.llm.ainvoke(messages, config=config)
+            if not response.tool_calls:
+                return {"output": content_text(response.content)}
+            messages.append(response)
+            messages.extend(await asyncio.gather(
+                *(self.call_tool(tool_call, config) for tool_call in response.tool_calls)
+            ))
+        response = await self.answer_llm.ainvoke(
+            messages + [HumanMessage(content=FINAL_ANSWER_PROMPT)], config=config
+        )
+        return {"output": content_text(response.content)}